@@ -0,0 +1,215 @@
+import os, sys, json, time, argparse
+from statistics import quantiles
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from simulation import Simulation
+from inputs import InputState, InputReplay
+from settings import *
+import pygame
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DT = 1 / FPS
+
+#subsystems timed on their own, as (label, owner attribute path, method name)
+SUBSYSTEMS = [
+    ('custom_draw', 'all_sprites', 'custom_draw'),
+    ('all_sprites.update', 'all_sprites', 'update'),
+    ('handle_interactions', None, 'handle_interactions'),
+    ('Compositor.apply', 'compositor', 'apply'), #sky tint and transition fade, the full-screen pass
+    ('Couriers.update', 'couriers', 'update'),
+    ('display_inventory', None, 'display_inventory'),
+]
+
+class Timings:
+    def __init__(self, level):
+        self.totals = {label: 0.0 for label, _, _ in SUBSYSTEMS}
+        for label, owner, name in SUBSYSTEMS:
+            target = getattr(level, owner) if owner else level
+            setattr(target, name, self.timed(label, getattr(target, name)))
+
+    def timed(self, label, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.totals[label] += time.perf_counter() - start
+            return result
+        return wrapper
+
+def frame(level, dt, inputs):
+    start = time.perf_counter()
+    level.step(dt, inputs)
+    pygame.display.update(level.draw())
+    return time.perf_counter() - start
+
+def hold(*keys):
+    return InputState(keys)
+
+#scenarios yield the input state of each frame and may set up the level first
+def idle(level):
+    for _ in range(300):
+        yield hold()
+
+def walk(level):
+    route = [(pygame.K_d, 4), (pygame.K_s, 3), (pygame.K_a, 4), (pygame.K_w, 3), (pygame.K_d, 2)]
+    for key, seconds in route:
+        for _ in range(int(seconds * FPS)):
+            yield hold(key)
+
+def rain(level):
+    level.raining = True
+    level.rain.spawn_rate *= 20 #heavy rain
+    for _ in range(60 * FPS):
+        yield hold()
+
+def couriers(level, count=5000):
+    level.couriers.spawn(count)
+    for _ in range(300):
+        yield hold()
+
+def crowd(level, count=100):
+    #enough couriers that a dozen or so are always on screen, for dirty rect mode (--dirty-rects)
+    level.couriers.spawn(count)
+    for _ in range(300):
+        yield hold()
+
+def map_open(level):
+    level.map_active = True
+    for _ in range(300):
+        yield hold()
+
+def dialogue(level):
+    level.dialogue_box.activate("You made it! The whole town has been waiting for the mail since the bridge washed out, "
+                                "and there are more parcels than anyone can remember. Take your time, courier.")
+    level.dialogue_active = True
+    for _ in range(300):
+        yield hold()
+
+def days(level, count=3):
+    end_day = level.day + count
+    while level.day < end_day or level.transition.state != 'idle':
+        if level.transition.state == 'idle':
+            level.sky.time = max(level.sky.time, level.sky.duration - 1) #skip to dusk
+        yield hold()
+
+SCENARIOS = {
+    'idle': idle,
+    'walk': walk,
+    'rain': rain,
+    'couriers': couriers,
+    'crowd': crowd,
+    'map': map_open,
+    'dialogue': dialogue,
+    'days': days,
+}
+
+def run_scenario(name, seed, dirty_rects=False):
+    level = Simulation(seed, dirty_rects).level
+    return measure(level, ((DT, inputs) for inputs in SCENARIOS[name](level)))
+
+def run_replay(path, dirty_rects=False):
+    #a recorded session (main.py --record) replayed with its own seed and frame times
+    replay = InputReplay(path)
+    level = Simulation(replay.seed, dirty_rects).level
+    return measure(level, replay)
+
+def run_headless(seed, days=1000):
+    #in-game days per second of a headless level stepped HEADLESS_STEP at a time, couriers walking, the player standing
+    simulation = Simulation(seed, headless=True)
+    start = time.perf_counter()
+    simulation.run_days(days, HEADLESS_STEP)
+    return days / (time.perf_counter() - start)
+
+def measure(level, frames):
+    timings = Timings(level)
+
+    frame_times = []
+    for dt, inputs in frames:
+        frame_times.append(frame(level, dt, inputs))
+
+    cuts = quantiles(frame_times, n=100)
+    return {
+        'frames': len(frame_times),
+        'p50': cuts[49] * 1000,
+        'p95': cuts[94] * 1000,
+        'p99': cuts[98] * 1000,
+        'sprites': {
+            'all_sprites': len(level.all_sprites),
+            'collision_sprites': len(level.collision_sprites),
+            'interaction_sprites': len(level.interaction_sprites),
+            'rain_particles': level.rain.floor.count + level.rain.drops.count,
+        },
+        'subsystems': {label: total / len(frame_times) * 1000 for label, total in timings.totals.items()},
+    }
+
+def report(name, result, baseline):
+    print(f"{name:<10} {result['frames']:>5} frames  p50 {result['p50']:6.2f}ms  p95 {result['p95']:6.2f}ms  "
+          f"p99 {result['p99']:6.2f}ms", end='')
+    print(f"  (baseline p95 {baseline['p95']:.2f}ms)" if baseline else '')
+    print('           sprites: ' + ', '.join(f'{key} {value}' for key, value in result['sprites'].items()))
+    print('           per frame: ' + ', '.join(f'{key} {value:.2f}ms' for key, value in result['subsystems'].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame time benchmarks on the SDL dummy video driver.')
+    parser.add_argument('scenarios', nargs='*', help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', metavar='PATH', action='append', default=[],
+                        help='also time a recorded session (main.py --record); its file name is the scenario name')
+    parser.add_argument('--headless', action='store_true',
+                        help='check headless days per second against HEADLESS_DAYS_TARGET (also done when running everything)')
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help='render in dirty rect mode (results are named <scenario>:dirty, with their own baselines)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown over the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baselines = json.load(file)
+
+    results = {}
+    regressions = []
+    suffix = ':dirty' if args.dirty_rects else ''
+    runs = [(name + suffix, lambda name=name: run_scenario(name, args.seed, args.dirty_rects))
+            for name in args.scenarios or ([] if args.replay or args.headless else SCENARIOS)]
+    runs += [(os.path.splitext(os.path.basename(path))[0] + suffix, lambda path=path: run_replay(path, args.dirty_rects))
+             for path in args.replay]
+    for name, run in runs:
+        results[name] = run()
+        baseline = baselines.get(name)
+        report(name, results[name], baseline)
+        if baseline and results[name]['p95'] > baseline['p95'] * (1 + args.tolerance):
+            regressions.append(name)
+
+    slow_days = None
+    if args.headless or not (args.scenarios or args.replay):
+        days_per_second = run_headless(args.seed)
+        print(f"{'headless':<10} {days_per_second:8.0f} days/s  (target {HEADLESS_DAYS_TARGET} days/s at {HEADLESS_STEP:g} s steps, "
+              f"couriers {'every ' + format(HEADLESS_COURIER_STEP, 'g') + ' s' if HEADLESS_COURIER_STEP else 'off'})")
+        if days_per_second < HEADLESS_DAYS_TARGET:
+            slow_days = days_per_second
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        baselines.update({name: {key: round(result[key], 3) for key in ('p50', 'p95', 'p99')}
+                          for name, result in results.items()})
+        with open(BASELINE_PATH, 'w') as file:
+            json.dump(baselines, file, indent=2)
+        print(f'Baseline updated: {BASELINE_PATH}')
+    elif regressions or slow_days is not None:
+        if regressions:
+            print(f"REGRESSION: p95 frame time over baseline by more than {args.tolerance:.0%} in: {', '.join(regressions)}")
+        if slow_days is not None:
+            print(f"REGRESSION: headless runs reach {slow_days:.0f} days/s, under the {HEADLESS_DAYS_TARGET} days/s target")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
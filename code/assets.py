@@ -0,0 +1,87 @@
+import os, pygame
+from os import walk
+from collections import OrderedDict
+from settings import *
+from mapcache import load_map
+from atlas import SpriteAtlas
+
+class AssetRegistry:
+    def __init__(self, capacity=ASSET_CACHE_SIZE):
+        #least recently used entries are evicted once the cache holds more than capacity assets
+        self.capacity = capacity
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.atlas = SpriteAtlas(GRAPHICS_DIR, ATLAS_FOLDERS) if SPRITE_ATLAS else None
+
+    def get(self, key, loader):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+        return self.put(key, loader())
+
+    def put(self, key, asset):
+        #also how the preloader hands over assets it loaded ahead of time
+        self.cache[key] = asset
+        self.cache.move_to_end(key)
+        if self.capacity and len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return asset
+
+    def image(self, path, alpha=True):
+        path = os.path.abspath(path)
+        def load():
+            surf = pygame.image.load(path)
+            return surf.convert_alpha() if alpha else surf.convert()
+        return self.get(('image', path, alpha), load)
+
+    def frames(self, path):
+        path = os.path.abspath(path)
+        def load():
+            #packed folders come out of the sprite atlas, anything else is loaded file by file
+            frames = self.atlas.frames(path) if self.atlas else None
+            return load_folder(path) if frames is None else frames
+        return self.get(('frames', path), load)
+
+    def font(self, path, size):
+        path = os.path.abspath(path)
+        return self.get(('font', path, size), lambda: pygame.font.Font(path, size))
+
+    def tmx(self, path):
+        path = os.path.abspath(path)
+        return self.get(('tmx', path), lambda: load_map(path))
+
+    def stats(self):
+        return {
+            'entries': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+def load_folder(path):
+    surface_list = []
+
+    #checks if path exists
+    if not os.path.exists(path):
+        print(f"Directory does not exist: {path}")
+        return surface_list
+
+    for root, _, files in walk(path):
+        for file in files:
+            if file.lower().endswith('.png'):  #only add .png files
+                full_path = os.path.join(root, file)
+                try:
+                    surface_list.append(assets.image(full_path))
+                except pygame.error:
+                    print(f'Error loading image: {full_path}')
+
+    return surface_list
+
+#shared by every module, so each file is decoded once per process
+assets = AssetRegistry()
@@ -0,0 +1,157 @@
+import os, json, pygame
+from settings import *
+from freshness import source_record, check_sources
+from problems import report
+
+def shelf_pack(sizes, width):
+    # Rows ("shelves") filled left to right, tallest sizes first. Returns the top-left of every
+    # size (in the given order) and the height the shelves take up
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > width:
+            x, y = 0, y + shelf_height
+            shelf_height = 0
+        positions[i] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return positions, y + shelf_height
+
+def pack_surfaces(surfaces, width=ATLAS_WIDTH):
+    #one transparent surface holding all the given surfaces, and the rect of each one inside it
+    sizes = [surf.get_size() for surf in surfaces]
+    width = max([width] + [w for w, _ in sizes])
+    positions, height = shelf_pack(sizes, width)
+
+    atlas = pygame.Surface((width, max(height, 1)), pygame.SRCALPHA)
+    rects = []
+    for surf, pos in zip(surfaces, positions):
+        # Copy pixels and alpha as they are (opaque surfaces come out with alpha 255)
+        atlas.blit(surf, pos, special_flags=pygame.BLEND_RGBA_MAX)
+        rects.append(pygame.Rect(pos, surf.get_size()))
+    return atlas, rects
+
+ATLAS_VERSION = 2
+
+def decode(path):
+    #pygame.image.load without the display conversion, so it can run on any thread
+    try:
+        return pygame.image.load(path)
+    except pygame.error:
+        return None
+
+def folder_images(path):
+    #.png files under path, in the order load_folder reads them
+    return [os.path.join(root, file) for root, _, files in os.walk(path) for file in files
+            if file.lower().endswith('.png')]
+
+class SpriteAtlas:
+    def __init__(self, root, folders, name='sprites'):
+        # Every frame folder under the given folders (relative to root) packed into one surface, kept in
+        # CACHE_DIR as raw RGBA (<name>.rgba, no PNG to decode) with a <name>.json manifest, so later
+        # launches skip decoding and packing
+        self.root = os.path.abspath(root)
+        self.folders = folders
+        self.image_path = os.path.join(CACHE_DIR, name + '.rgba')
+        self.manifest_path = os.path.join(CACHE_DIR, name + '.json')
+        self.surface = None
+        self.frame_rects = None
+
+    def frame_folders(self):
+        found = []
+        for folder in self.folders:
+            for path, _, files in os.walk(os.path.join(self.root, folder)):
+                if any(file.lower().endswith('.png') for file in files):
+                    found.append(path)
+        return found
+
+    def sources(self, folders):
+        #every frame file (relative to root) in packing order, the manifest has to list the same ones
+        return [os.path.relpath(path, self.root) for folder in folders for path in folder_images(folder)]
+
+    def check(self):
+        # (folders, sources, manifest): the manifest is None when the persisted atlas is missing or stale
+        # (see freshness.check_sources). Only reads and writes files, so the preloader runs it ahead of read() and restore()
+        folders = self.frame_folders()
+        sources = self.sources(folders)
+        try:
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            if manifest['version'] == ATLAS_VERSION and [source['path'] for source in manifest['sources']] == sources:
+                fresh, touched = check_sources(self.root, manifest['sources'])
+                if fresh and touched:
+                    try:
+                        self.write_manifest(manifest) #the refreshed modification times
+                    except OSError:
+                        pass #the sources get hashed again next time
+                if fresh:
+                    return folders, sources, manifest
+        except (OSError, ValueError, KeyError):
+            pass #no atlas yet, or a broken one
+        return folders, sources, None
+
+    def read(self):
+        #the persisted pixels, safe off the main thread
+        with open(self.image_path, 'rb') as file:
+            return file.read()
+
+    def restore(self, manifest, data):
+        self.surface = pygame.image.frombuffer(data, manifest['size'], 'RGBA').convert_alpha()
+        self.frame_rects = manifest['frames']
+
+    def load(self):
+        folders, sources, manifest = self.check()
+        if manifest is not None:
+            try:
+                self.restore(manifest, self.read())
+                return
+            except (OSError, ValueError):
+                pass #manifest without its pixels
+        self.build(folders, sources)
+
+    def build(self, folders, sources, decoded=None):
+        # decoded optionally holds the frame files already decoded (not converted), in folder_images order,
+        # None for the ones that failed
+        files = [(folder, path) for folder in folders for path in folder_images(folder)]
+        if decoded is None:
+            decoded = [decode(path) for _, path in files]
+
+        frames = []
+        keys = []
+        for (folder, path), surf in zip(files, decoded):
+            if surf is None:
+                report(f'Error loading image: {path}')
+                continue
+            frames.append(surf.convert_alpha())
+            keys.append(os.path.relpath(folder, self.root))
+
+        self.surface, rects = pack_surfaces(frames)
+        self.frame_rects = {}
+        for key, rect in zip(keys, rects):
+            self.frame_rects.setdefault(key, []).append(list(rect))
+
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(self.image_path, 'wb') as file:
+                file.write(pygame.image.tobytes(self.surface, 'RGBA'))
+            self.write_manifest({'version': ATLAS_VERSION, 'size': self.surface.get_size(),
+                                 'sources': [source_record(self.root, os.path.join(self.root, path)) for path in sources],
+                                 'frames': self.frame_rects})
+        except OSError as error:
+            report(f"Warning: could not write the sprite atlas {self.image_path}: {error}")
+
+    def write_manifest(self, manifest):
+        with open(self.manifest_path + '.tmp', 'w') as file:
+            json.dump(manifest, file)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def frames(self, path):
+        #subsurfaces of the atlas for a packed folder, None for a folder the atlas doesn't hold
+        if self.frame_rects is None:
+            self.load()
+        rects = self.frame_rects.get(os.path.relpath(os.path.abspath(path), self.root))
+        if rects is None:
+            return None
+        return [self.surface.subsurface(rect) for rect in rects]
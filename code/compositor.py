@@ -0,0 +1,35 @@
+import pygame
+from settings import *
+from profiler import profiler
+
+IDENTITY = (255, 255, 255)
+
+class Compositor:
+    def __init__(self):
+        self.display_surface = pygame.display.get_surface()
+        self.color = IDENTITY #last factor applied, for renderers that need to know it changed
+
+        #blitting a plain surface with a blend flag takes SDL's SIMD path, filling with one doesn't
+        self.overlay = pygame.Surface(self.display_surface.get_size())
+        self.overlay_color = None
+
+    def combine(self, *colors):
+        #multiply tints together, 255 being 1.0
+        r, g, b = IDENTITY
+        for color in colors:
+            r = r * color[0] // 255
+            g = g * color[1] // 255
+            b = b * color[2] // 255
+        return (r, g, b)
+
+    def apply(self, *colors):
+        #a single full screen multiply pass, skipped entirely when it would change nothing
+        self.color = self.combine(*colors)
+        if self.color == IDENTITY:
+            return
+
+        if self.color != self.overlay_color:
+            self.overlay.fill(self.color)
+            self.overlay_color = self.color
+        self.display_surface.blit(self.overlay, (0, 0), special_flags = pygame.BLEND_RGB_MULT)
+        profiler.count('blits')
@@ -0,0 +1,198 @@
+import os, pygame
+import numpy as np
+from settings import *
+from support import import_folder
+from profiler import profiler
+
+#animation rows, walking first: facing + 4 is the matching idle animation
+ANIMATIONS = ('up', 'down', 'left', 'right', 'up_idle', 'down_idle', 'left_idle', 'right_idle')
+UP, DOWN, LEFT, RIGHT = range(4)
+
+class Couriers:
+    def __init__(self, all_sprites, route_planner, count=COURIER_COUNT, seed=None):
+        # NPC couriers walking from door to door. Each courier is one row of the arrays below, moved in
+        # batches down the doors' distance fields and drawn by the camera among the main layer sprites
+        self.rng = np.random.default_rng(seed)
+        nav = route_planner.nav
+        self.width, self.height = nav.width, nav.height
+        self.walkable = ~self.unpack(nav.mask).ravel() #the mask's bits as one bool per tile, for batched lookups
+
+        # Per door: the distance to it from every tile, and the neighbouring tile one step closer
+        door_tiles = list(route_planner.doors.values())
+        self.fields = np.array([nav.distance_field(tile) for tile in door_tiles], np.int32).reshape(len(door_tiles), -1)
+        self.next_tiles = self.flow(self.fields)
+        self.door_tiles = np.argmax(self.fields == 0, axis=1).astype(np.int32) #the one tile at distance 0
+        tiles = np.arange(self.width * self.height)
+        self.centre_x = ((tiles % self.width + 0.5) * TILE_SIZE).astype(np.float32) #world position of every tile's centre
+        self.centre_y = ((tiles // self.width + 0.5) * TILE_SIZE).astype(np.float32)
+        self.delivered = 0
+
+        self.import_assets()
+        self.spawn(count)
+        all_sprites.add_batch(LAYERS['main'], self.draw_items)
+
+    @staticmethod
+    def unpack(mask):
+        #(height, width) bools, True where the CollisionMask has the tile blocked
+        row_bytes = (mask.width + 7) // 8
+        data = b''.join(row.to_bytes(row_bytes, 'little') for row in mask.rows)
+        bits = np.frombuffer(data, np.uint8).reshape(mask.height, row_bytes)
+        return np.unpackbits(bits, axis=1, bitorder='little')[:, :mask.width].astype(bool)
+
+    def flow(self, fields):
+        # For every door and tile, the neighbour with the smallest distance (the tile itself at the door
+        # or where the door can't be reached). Couriers only ever walk between a tile and one of these
+        width, height = self.width, self.height
+        tiles = np.arange(width * height)
+        x, y = tiles % width, tiles // width
+        distances = np.where(fields < 0, np.iinfo(np.int32).max, fields)
+
+        best = np.broadcast_to(tiles, fields.shape).copy()
+        best_distance = distances.copy()
+        for dx, dy, inside in ((0, -1, y > 0), (0, 1, y < height - 1), (-1, 0, x > 0), (1, 0, x < width - 1)):
+            neighbours = np.where(inside, tiles + dy * width + dx, tiles)
+            closer = distances[:, neighbours] < best_distance
+            best[closer] = np.broadcast_to(neighbours, fields.shape)[closer]
+            best_distance = np.minimum(best_distance, distances[:, neighbours])
+        return best
+
+    def import_assets(self):
+        # The player's frames cropped to what isn't transparent, once per tint: [tint][animation] -> [(image, dx, dy)]
+        # where (dx, dy) places the image relative to the courier's position (the centre of the full frame)
+        base_path = os.path.dirname(os.path.dirname(__file__))
+        self.frames = []
+        self.margin = 0 #how far outside the view a courier can still show
+        for tint in COURIER_TINTS:
+            animations = []
+            for animation in ANIMATIONS:
+                frames = []
+                for frame in import_folder(os.path.join(base_path, 'graphics', 'character', animation)):
+                    bounds = frame.get_bounding_rect()
+                    self.margin = max(self.margin, *frame.get_size())
+                    image = frame.subsurface(bounds).copy()
+                    image.fill(tint, special_flags=pygame.BLEND_RGB_MULT)
+                    frames.append((image, bounds.x - frame.get_width() // 2, bounds.y - frame.get_height() // 2))
+                animations.append(frames)
+            self.frames.append(animations)
+        self.frame_counts = np.array([len(frames) for frames in self.frames[0]])
+
+    def spawn(self, count):
+        # Replaces every courier: count of them on random tiles that reach at least one door
+        reachable = np.flatnonzero((self.fields >= 0).any(axis=0)) if len(self.fields) else np.array([], int)
+        if not len(reachable):
+            count = 0
+        self.count = count
+        tiles = self.rng.choice(reachable, count) if count else np.zeros(0, int)
+
+        self.pos = np.empty((count, 2), np.float32)
+        self.pos[:, 0] = self.centre_x[tiles]
+        self.pos[:, 1] = self.centre_y[tiles]
+        # The tile under each courier, kept up to date by update instead of divided out of pos every step
+        self.tiles = tiles.astype(np.int32)
+        self.tile_x = self.tiles % self.width
+        self.tile_y = self.tiles // self.width
+        self.previous_pos = self.pos.copy() #positions when the last level step started, for interpolated drawing
+        self.alpha = 1 #how far from previous_pos to pos draw_items places the couriers
+        self.target = np.zeros(count, np.int32)
+        self.pick_targets(np.arange(count), tiles)
+
+        self.speed = (COURIER_SPEED * self.rng.uniform(0.75, 1.25, count)).astype(np.float32)
+        self.wait = np.zeros(count, np.float32) #seconds left at a door
+        self.facing = np.full(count, DOWN, np.int8)
+        self.moving = np.zeros(count, bool)
+        self.frame_time = self.rng.uniform(0, 4, count).astype(np.float32)
+        self.tint = self.rng.integers(0, len(COURIER_TINTS), count).astype(np.int8)
+        self.drawn = set() #(image, screen position) of every courier in the last changed_rects
+
+    def pick_targets(self, couriers, tiles):
+        #a random door for each given courier, one it can reach from its tile (the first reachable one after a few tries)
+        doors = len(self.fields)
+        for _ in range(4):
+            self.target[couriers] = self.rng.integers(0, doors, len(couriers))
+            unreachable = self.fields[self.target[couriers], tiles] < 0
+            couriers, tiles = couriers[unreachable], tiles[unreachable]
+            if not len(couriers):
+                return
+        self.target[couriers] = np.argmax(self.fields[:, tiles] >= 0, axis=0)
+
+    def update(self, dt):
+        # Every courier walks from the centre of its tile straight to the centre of a neighbouring one, so a
+        # position never leaves the map and the tile under it only has to be looked up again once it moves
+        if not self.count:
+            return
+        pos, tiles = self.pos, self.tiles
+
+        # At the door: drop the package, wait a moment, then head for another door
+        self.wait = np.maximum(self.wait - dt, 0)
+        arrived = np.flatnonzero((tiles == self.door_tiles[self.target]) & (self.wait == 0))
+        if len(arrived):
+            self.delivered += len(arrived)
+            self.wait[arrived] = COURIER_WAIT
+            self.pick_targets(arrived, tiles[arrived])
+
+        # Walk towards the centre of the next tile on the way
+        next_tiles = self.next_tiles[self.target, tiles]
+        delta_x = self.centre_x[next_tiles] - pos[:, 0]
+        delta_y = self.centre_y[next_tiles] - pos[:, 1]
+        distance = np.hypot(delta_x, delta_y)
+        self.moving = (self.wait == 0) & (distance > 0.5)
+        step = np.minimum(self.speed * dt, distance) / np.maximum(distance, 1e-6) * self.moving
+
+        # Tile collision one axis at a time, like the player: a move into a blocked tile is dropped
+        new_x = pos[:, 0] + delta_x * step
+        new_tile_x = (new_x // TILE_SIZE).astype(np.int32)
+        across = tiles + (new_tile_x - self.tile_x)
+        free = self.walkable[across]
+        pos[:, 0] = np.where(free, new_x, pos[:, 0])
+        self.tile_x = np.where(free, new_tile_x, self.tile_x)
+        tiles = np.where(free, across, tiles)
+
+        new_y = pos[:, 1] + delta_y * step
+        new_tile_y = (new_y // TILE_SIZE).astype(np.int32)
+        across = tiles + (new_tile_y - self.tile_y) * self.width
+        free = self.walkable[across]
+        pos[:, 1] = np.where(free, new_y, pos[:, 1])
+        self.tile_y = np.where(free, new_tile_y, self.tile_y)
+        self.tiles = np.where(free, across, tiles)
+
+        horizontal = np.abs(delta_x) > np.abs(delta_y)
+        facing = np.where(horizontal, np.where(delta_x > 0, RIGHT, LEFT), np.where(delta_y > 0, DOWN, UP))
+        self.facing = np.where(self.moving, facing, self.facing).astype(np.int8)
+        self.frame_time += 4 * dt
+
+    def draw_items(self, view, offset):
+        items = self.visible_items(view, offset)
+        profiler.count('blits', len(items))
+        return items
+
+    def changed_rects(self, view, offset):
+        # Screen rects to redraw for dirty rect drawing: where the couriers that moved or show another
+        # frame were drawn last time, and where they go now
+        drawn = {(image, pos) for _, image, pos in self.visible_items(view, offset)}
+        changed = drawn ^ self.drawn
+        self.drawn = drawn
+        return [image.get_rect(topleft=pos) for image, pos in changed]
+
+    def visible_items(self, view, offset):
+        # (sort y, image, screen position) for the couriers inside view (a world rect), in y order
+        if not self.count:
+            return []
+        pos = self.pos if self.alpha >= 1 else self.previous_pos + (self.pos - self.previous_pos) * self.alpha
+        x, y = pos[:, 0], pos[:, 1]
+        margin = self.margin
+        visible = np.flatnonzero((x > view.left - margin) & (x < view.right + margin) &
+                                 (y > view.top - margin) & (y < view.bottom + margin))
+        visible = visible[np.argsort(y[visible], kind='stable')]
+
+        animations = self.facing[visible] + np.where(self.moving[visible], 0, 4)
+        frame_indices = self.frame_time[visible].astype(np.int32) % self.frame_counts[animations]
+        screen_x = np.rint(x[visible]).astype(np.int32) - offset[0]
+        screen_y = np.rint(y[visible]).astype(np.int32) - offset[1]
+
+        items = []
+        frames = self.frames
+        for sort_y, tint, animation, index, sx, sy in zip(y[visible].tolist(), self.tint[visible].tolist(), animations.tolist(),
+                                                          frame_indices.tolist(), screen_x.tolist(), screen_y.tolist()):
+            image, dx, dy = frames[tint][animation][index]
+            items.append((sort_y, image, (sx + dx, sy + dy)))
+        return items
@@ -1,6 +1,9 @@
 import pygame
 import os
 from settings import *
+from assets import assets
+from profiler import profiler
+from text import GlyphAtlas, TypewriterText
 
 class DialogueBox:
     def __init__(self, screen, font_path, font_size, box_image_path, text="Dialogue text"):
@@ -31,31 +34,34 @@ class DialogueBox:
         self.text_area_width = self.box_rect.width - (2 * self.text_padding)
         self.text_area_top = self.box_rect.top + self.text_padding
 
+        # Glyphs are rasterized once, wrapped layouts are cached and revealed a few glyphs per frame
+        self.atlas = GlyphAtlas(self.font, self.text_color)
+        self.reveal_speed = DIALOGUE_REVEAL_SPEED
+        text_area_size = (self.box_rect.width - self.text_padding, self.box_rect.bottom - self.text_area_top)
+        self.typewriter = TypewriterText(self.atlas, text_area_size, self.text_area_width, line_spacing=5)
+        self.typewriter.set_text(self.text)
+        self.prompt_surface = self.atlas.render("[Press Escape to Exit]")
+
         self.active = False
 
     def load_font(self, path, size):
         try:
-            return pygame.font.Font(path, size)
+            return assets.font(path, size)
         except FileNotFoundError:
             print(f"Error: Font file not found at {path}. Using default font.")
             return pygame.font.SysFont("Arial", size)
 
     def load_image(self, path):
         try:
-            return pygame.image.load(path).convert_alpha()
+            return assets.image(path)
         except pygame.error:
             print(f"Error: Failed to load image {path}.")
             return None
 
-    def update(self):
+    def update(self, dt=0):
         if self.active:
-            self.handle_input()
-            self.render()
-
-    def handle_input(self):
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                self.deactivate()
+            self.typewriter.speed = self.reveal_speed
+            self.typewriter.update(dt)
 
     def render(self):
         if not self.active:
@@ -70,42 +76,23 @@ class DialogueBox:
 
         # Render wrapped dialogue text
         self.render_wrapped_text()
+        profiler.count('blits', 3)
 
     def render_wrapped_text(self):
-        words = self.text.split(" ")
-        wrapped_lines = []
-        current_line = ""
-
-        for word in words:
-            test_line = f"{current_line} {word}".strip()
-            test_surface = self.font.render(test_line, True, self.text_color)
-            if test_surface.get_width() <= self.text_area_width:
-                current_line = test_line
-            else:
-                wrapped_lines.append(current_line)
-                current_line = word
-
-        if current_line:
-            wrapped_lines.append(current_line)
-
-        y_offset = self.text_area_top
-        for line in wrapped_lines:
-            line_surface = self.font.render(line, True, self.text_color)
-            self.screen.blit(line_surface, (self.box_rect.left + self.text_padding, y_offset))
-            y_offset += line_surface.get_height() + 5
+        # Newly revealed glyphs were already added to the cached text surface in update
+        self.screen.blit(self.typewriter.surface, (self.box_rect.left + self.text_padding, self.text_area_top))
 
         # Render prompt text at the bottom
-        prompt_text = "[Press Escape to Exit]"
-        prompt_surface = self.font.render(prompt_text, True, self.text_color)
         prompt_position = (
             self.box_rect.left + self.text_padding,
-            self.box_rect.bottom - self.text_padding - prompt_surface.get_height()
+            self.box_rect.bottom - self.text_padding - self.prompt_surface.get_height()
         )
-        self.screen.blit(prompt_surface, prompt_position)
+        self.screen.blit(self.prompt_surface, prompt_position)
 
     def update_text(self, new_text):
         if new_text:
             self.text = new_text
+            self.typewriter.set_text(self.text)
             # print(f"Updated dialogue text to: {self.text}")
         else:
             print("Warning: Tried to update dialogue with empty text.")
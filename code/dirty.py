@@ -0,0 +1,43 @@
+import pygame
+from settings import *
+
+class DirtyRegion:
+    def __init__(self, bounds, limit=DIRTY_RECT_LIMIT):
+        # Screen areas that changed since the last frame. Past limit separate areas (or half the
+        # screen) redrawing everything is cheaper, so the frame is drawn in full instead
+        self.bounds = pygame.Rect(bounds)
+        self.limit = limit
+        self.rects = []
+        self.full = True #nothing on screen yet
+
+    def add(self, rect):
+        if not self.full:
+            rect = self.bounds.clip(rect)
+            if rect.width and rect.height:
+                self.rects.append(rect)
+
+    def invalidate(self):
+        self.full = True
+
+    def take(self):
+        #the areas to redraw and present this frame, None for the whole screen; starts the next frame empty
+        rects = None
+        if not self.full:
+            rects = merge_rects(self.rects)
+            if len(rects) > self.limit or sum(rect.width * rect.height for rect in rects) > self.bounds.width * self.bounds.height // 2:
+                rects = None
+        self.rects = []
+        self.full = False
+        return rects
+
+def merge_rects(rects):
+    #overlapping areas become their bounding box, until none overlap
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index >= 0:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
@@ -0,0 +1,31 @@
+import os, hashlib
+
+# Caches built from files on disk (the map cache, the sprite atlas) record every source file as
+# {'path', 'mtime', 'size', 'sha1'} and check them here before trusting what they hold
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def source_record(folder, path):
+    #what a cache stores about a source file, path relative to folder
+    stat = os.stat(path)
+    return {'path': os.path.relpath(path, folder), 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': file_hash(path)}
+
+def check_sources(folder, sources):
+    # (fresh, touched): fresh when every source still holds what was recorded. A file with a new modification
+    # time (e.g. after a checkout) but the same size and hash counts as unchanged; its record gets the new
+    # time and touched is True, so the caller can write the records back and skip the hashing next time
+    touched = False
+    for source in sources:
+        path = os.path.join(folder, source['path'])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False, False
+        if (stat.st_mtime_ns, stat.st_size) != (source['mtime'], source['size']):
+            if stat.st_size != source['size'] or file_hash(path) != source['sha1']:
+                return False, False
+            source['mtime'] = stat.st_mtime_ns
+            touched = True
+    return True, touched
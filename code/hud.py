@@ -0,0 +1,68 @@
+import pygame
+from settings import *
+from profiler import profiler
+
+class Widget:
+    def __init__(self, **anchor):
+        #anchor is passed to get_rect, e.g. topleft=(20, 20) or center=(640, 360)
+        self.anchor = anchor
+        self.surface = None
+        self.rect = None
+
+    def refresh(self):
+        #re-render only when needed, returns True when the cached surface changed
+        return False
+
+    def draw(self, surface):
+        self.refresh()
+        surface.blit(self.surface, self.rect)
+        profiler.count('blits')
+
+class ImageWidget(Widget):
+    def __init__(self, image, size=None, **anchor):
+        super().__init__(**anchor)
+        self.surface = pygame.transform.scale(image, size) if size else image
+        self.rect = self.surface.get_rect(**anchor)
+
+class TextWidget(Widget):
+    def __init__(self, font, bind, color, template='{}', **anchor):
+        super().__init__(**anchor)
+        self.font = font
+        self.bind = bind #static text or a callable returning the current value
+        self.color = color
+        self.template = template
+        self.value = None
+        self.refresh()
+
+    def refresh(self):
+        value = self.bind() if callable(self.bind) else self.bind
+        if self.surface is not None and value == self.value:
+            return False
+
+        self.value = value
+        self.surface = self.font.render(self.template.format(value), True, self.color)
+        profiler.count('font.render')
+        self.rect = self.surface.get_rect(**self.anchor)
+        return True
+
+class Hud:
+    def __init__(self, surface):
+        self.display_surface = surface
+        self.widgets = []
+
+    def add(self, widget):
+        self.widgets.append(widget)
+        return widget
+
+    def changed_rects(self):
+        #areas of the widgets that re-rendered since the last call, where they were and where they are now
+        rects = []
+        for widget in self.widgets:
+            old_rect = widget.rect
+            if widget.refresh():
+                rects += [rect for rect in (old_rect, widget.rect) if rect is not None]
+        return rects
+
+    def draw(self):
+        for widget in self.widgets:
+            widget.draw(self.display_surface)
@@ -0,0 +1,121 @@
+import pygame, struct
+from settings import *
+
+#recording layout: one header, then one record per frame (dt as float32, then the held, pressed and released
+#keys as bitmasks over INPUT_KEYS)
+RECORDING_MAGIC = b'AMIN'
+RECORDING_VERSION = 2
+HEADER = struct.Struct('<4sHHI') #magic, version, key count, seed
+FRAME = struct.Struct('<fHHH') #dt, held mask, pressed mask, released mask
+
+def key_mask(keys):
+    return sum(1 << bit for bit, key in enumerate(INPUT_KEYS) if key in keys)
+
+def mask_keys(mask):
+    return [key for bit, key in enumerate(INPUT_KEYS) if mask >> bit & 1]
+
+class InputState:
+    def __init__(self, held=(), pressed=(), released=()):
+        #keys held this frame, indexed by pygame key constants like pygame.key.get_pressed()
+        self.held = frozenset(held)
+        #keys that went down or up since the last frame
+        self.pressed = frozenset(pressed)
+        self.released = frozenset(released)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+    @classmethod
+    def from_masks(cls, held, pressed=0, released=0):
+        return cls(mask_keys(held), mask_keys(pressed), mask_keys(released))
+
+    @property
+    def masks(self):
+        return key_mask(self.held), key_mask(self.pressed), key_mask(self.released)
+
+class InputDispatcher:
+    def __init__(self):
+        #handlers by (event type, key), key is None for events without one (e.g. pygame.QUIT)
+        self.handlers = {}
+        self.held = set()
+
+    def subscribe(self, key, handler, event_type=pygame.KEYDOWN):
+        self.handlers.setdefault((event_type, key), []).append(handler)
+
+    def emit(self, event_type, key=None):
+        for handler in self.handlers.get((event_type, key), ()):
+            handler()
+
+    def pump(self):
+        # Drains the event queue, once per frame: every event goes to its subscribers and
+        # key events make up the frame's InputState
+        pressed, released = set(), set()
+        for event in pygame.event.get():
+            if event.type == pygame.KEYDOWN:
+                self.held.add(event.key)
+                pressed.add(event.key)
+            elif event.type == pygame.KEYUP:
+                self.held.discard(event.key)
+                released.add(event.key)
+            self.emit(event.type, getattr(event, 'key', None))
+        return InputState(self.held, pressed, released)
+
+    def dispatch(self, inputs):
+        # Routes the key changes of a frame snapshot (live, replayed or scripted) to the subscribers,
+        # in key order so a replay fires them exactly like the recorded session
+        for key in sorted(inputs.pressed):
+            self.emit(pygame.KEYDOWN, key)
+        for key in sorted(inputs.released):
+            self.emit(pygame.KEYUP, key)
+
+class InputRecorder:
+    def __init__(self, path, seed):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, len(INPUT_KEYS), seed))
+        self.frames = 0
+
+    def record(self, dt, inputs):
+        data = FRAME.pack(dt, *inputs.masks)
+        self.file.write(data)
+        self.frames += 1
+        #dt as stored, so the recorded session runs on exactly what a replay will see
+        return FRAME.unpack(data)[0]
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class InputReplay:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        if len(data) < HEADER.size:
+            raise ValueError(f'{path}: not an input recording')
+        magic, version, key_count, self.seed = HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f'{path}: not an input recording')
+        if version != RECORDING_VERSION or key_count != len(INPUT_KEYS):
+            raise ValueError(f'{path}: recorded with an incompatible input layout (version {version}, {key_count} keys)')
+
+        body = data[HEADER.size:]
+        body = body[:len(body) - len(body) % FRAME.size] #drop a partial last frame (e.g. the game was killed)
+        self.frames = list(FRAME.iter_unpack(body))
+        self.index = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        #every (dt, InputState) pair from the start, independent of next()
+        for dt, *masks in self.frames:
+            yield dt, InputState.from_masks(*masks)
+
+    @property
+    def done(self):
+        return self.index >= len(self.frames)
+
+    def next(self):
+        dt, *masks = self.frames[self.index]
+        self.index += 1
+        return dt, InputState.from_masks(*masks)
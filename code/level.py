@@ -1,53 +1,66 @@
 import os
 import pygame
 import random
+from bisect import bisect_left
+from operator import itemgetter
+from contextlib import contextmanager
 from settings import *
 from player import Player
 from sprites import *
-from pytmx.util_pygame import load_pygame
 from support import *
+from assets import assets
 from transition import Transition
 from sky import *
+from compositor import Compositor
 from map import Map
 from dialogue import DialogueBox
+from hud import Hud, ImageWidget, TextWidget
+from profiler import profiler
+from spatial import SpatialGrid, CollisionGroup, CollisionMask
+from inputs import InputDispatcher
+from nav import NavGrid, RoutePlanner
+from world import ChunkedWorld
+from dirty import DirtyRegion
+from couriers import Couriers
 
 class Level:
-    def __init__(self, screen):
+    def __init__(self, screen, seed=None, dirty_rects=DIRTY_RECTS, headless=False, staged=False):
         # Get display surface
         self.display_surface = screen
 
+        # Headless levels are only stepped, never drawn: work that only feeds the picture is skipped
+        # (see step) and the couriers move every HEADLESS_COURIER_STEP seconds, if at all
+        self.headless = headless
+        self.dirty_rects = dirty_rects
+
+        # Every random roll goes through one seeded generator, so runs can be reproduced
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.day = 1
+
         # Sprite groups
         self.all_sprites = None  # Set up later
-        self.collision_sprites = pygame.sprite.Group()
+        self.collision_sprites = CollisionGroup()
         self.interaction_sprites = pygame.sprite.Group()
+        self.door_grid = SpatialGrid(TILE_SIZE, attr='hitbox')  # doors by tile, looked up around the player
 
         # Package & doors
         self.doors_assigned = False
+        self.door_state_to_update = None  # door delivered to, marked once its dialogue closes
 
-        self.setup()
-
-        # Weather / sky
-        self.rain = Rain(self.all_sprites)
-        self.raining = random.randint(0, 10) > 5
-        self.sky = Sky()
-
-        # Transition
-        self.transition = Transition(self.reset, self.sky)
-
-        # Dialogue
-        font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
-        box_image_path = os.path.join(os.path.dirname(__file__), "../graphics/ui/box.png")
-        self.dialogue_box = DialogueBox(screen, font_path, 20, box_image_path)
-        self.dialogue_active = False
-
-        # Map
-        self.map = Map(self.player, self.toggle_map)
-        self.map_active = False
+        # Everything else is built in stages, in this order: all of them right away, or when staged by
+        # whoever created the level, e.g. one per loading screen frame (see Game.load)
+        self.build_stages = [self.setup, self.setup_player, self.create_weather, self.create_overlays, self.create_couriers]
+        if not staged:
+            for stage in self.build_stages:
+                stage()
 
     def setup(self):
+        # Static world: built once and kept across days (see reset)
+
         # Load map
         map_path = os.path.join(os.path.dirname(__file__), "../data/map.tmx")
-        self.tmx_data = load_pygame(map_path)
+        self.tmx_data = assets.tmx(map_path)
 
         # Define level boundaries
         self.level_width = self.tmx_data.width * TILE_SIZE
@@ -63,14 +76,60 @@ class Level:
 
         # Create map layers & background
         self.create_map_layers(self.tmx_data)
+        self.create_collision_mask(self.tmx_data)
         self.create_background()
 
+    def setup_player(self):
         # Player-related setup
         self.create_player(self.tmx_data)
+        self.create_navigation(self.tmx_data)
+        self.world.update(self.player.rect.center, self.player.direction)
 
         # Packages & doors
         self.assign_packages_to_doors(self.tmx_data)
 
+    def create_weather(self):
+        # Weather / sky
+        self.rain = Rain(self.all_sprites, self.random.getrandbits(32))
+        self.raining = self.random.randint(0, 10) > 5
+        self.sky = Sky()
+        self.compositor = Compositor()
+
+        # Transition
+        self.transition = Transition(self.reset, self.sky)
+
+    def create_overlays(self):
+        # Dialogue
+        font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
+        box_image_path = os.path.join(os.path.dirname(__file__), "../graphics/ui/box.png")
+        self.dialogue_box = DialogueBox(self.display_surface, font_path, 20, box_image_path)
+        self.dialogue_active = False
+
+        # HUD
+        self.create_hud()
+
+        # Dirty rect rendering: only what changed is redrawn (see draw), from what the camera, HUD and overlays report
+        self.dirty = DirtyRegion(self.display_surface.get_rect()) if self.dirty_rects else None
+        self.drawn_state = None
+        self.all_sprites.track_changes = self.dirty_rects
+
+        # Map
+        self.map = Map(self.player, self.tmx_data, lambda: self.door_states, self.delivery_route)
+        self.map_active = False
+
+        # Key actions, fired once per press instead of polled every frame
+        self.controls = InputDispatcher()
+        self.controls.subscribe(pygame.K_f, self.interact)
+        self.controls.subscribe(pygame.K_m, self.toggle_map)
+        self.controls.subscribe(pygame.K_ESCAPE, self.close_overlay)
+
+    def create_couriers(self):
+        # NPC couriers making their own rounds (they have their own generator, so leaving them out changes nothing else)
+        courier_count = COURIER_COUNT if not self.headless or HEADLESS_COURIER_STEP else 0
+        self.couriers = Couriers(self.all_sprites, self.route_planner, courier_count, self.random.getrandbits(32))
+        self.courier_step = HEADLESS_COURIER_STEP if self.headless else 0
+        self.courier_time = 0
+
     def create_map_layers(self, tmx_data):
         # Define layer handling
         layer_definitions = {
@@ -84,32 +143,26 @@ class Level:
             'Trees': [self.all_sprites, self.collision_sprites]
         }
 
-        # Iterate through map layers
-        for layer_name, groups in layer_definitions.items():
-            if layer_name in ['Fence', 'HouseWall', 'HouseDoor', 'HouseRoof', 'Collision']:
-                for x, y, surf in tmx_data.get_layer_by_name(layer_name).tiles():
-                    Generic((x * TILE_SIZE, y * TILE_SIZE), surf, groups)
-            
-            elif layer_name == 'Water':
-                water_path = os.path.join(os.path.dirname(__file__), "../graphics/water")
-                water_frames = import_folder(water_path)
-                for x, y, surf in tmx_data.get_layer_by_name(layer_name).tiles():
-                    Water((x * TILE_SIZE, y * TILE_SIZE), water_frames, groups)
-            
-            elif layer_name in ['Decoration', 'Trees']:
-                for obj in tmx_data.get_layer_by_name(layer_name):
-                    if hasattr(obj, 'image'):
-                        if layer_name == 'Decoration':
-                            WildFlower((obj.x, obj.y), obj.image, groups)
+        water_path = os.path.join(os.path.dirname(__file__), "../graphics/water")
+        water_frames = import_folder(water_path)
+        self.water_clock = AnimationClock(len(water_frames), 5)
+
+        # Layers are split into chunks: all of them are built here, or with WORLD_STREAMING
+        # only the ones around the player, as it moves (see step)
+        self.world = ChunkedWorld(tmx_data, layer_definitions, self.all_sprites, water_frames, self.water_clock)
 
-                        else:
-                            Trees((obj.x, obj.y), obj.image, groups, obj.name)
+    def create_collision_mask(self, tmx_data):
+        # Blocked tiles: every tile a collision hitbox (Collision tiles, fences, trees) touches, across the
+        # whole map whether its chunk is loaded or not. Navigation and the couriers walk on this grid
+        self.collision_mask = CollisionMask(tmx_data.width, tmx_data.height)
+        for hitbox in self.world.hitboxes(self.collision_sprites):
+            self.collision_mask.block(hitbox)
 
     def create_background(self):
         ground_path = os.path.join(os.path.dirname(__file__), "../graphics/world/ground.png")
         Generic(
             pos=(0, 0),
-            surf=pygame.image.load(ground_path).convert_alpha(),
+            surf=assets.image(ground_path),
             groups=self.all_sprites,
             z=LAYERS['ground']
         )
@@ -117,20 +170,35 @@ class Level:
     def create_player(self, tmx_data):
         for obj in tmx_data.get_layer_by_name('Player'):
             if obj.name == 'Start':
+                self.player_start = (obj.x, obj.y)
                 self.player = Player(
                     pos=(obj.x, obj.y),
                     group=self.all_sprites,
                     collision_sprites=self.collision_sprites,
-                    interaction=self.interaction_sprites,
                     screen=self.display_surface,
-                    toggle_dialogue_box=self.toggle_dialogue_box,
-                    toggle_map=self.toggle_map
+                    rng=self.random
                 )
+                self.player.animating = not self.headless
                 self.player.level_bounds = self.level_bounds
-                self.player.inventory = {'packages': random.randint(7, 12)}
+                self.player.inventory = {'packages': self.random.randint(7, 12)}
             
             if obj.name.startswith('Door'):
-                Interaction((obj.x, obj.y), (obj.width, obj.height), self.interaction_sprites, obj.name)
+                door = Interaction((obj.x, obj.y), (obj.width, obj.height), self.interaction_sprites, obj.name)
+                self.door_grid.insert(door)
+
+    def create_navigation(self, tmx_data):
+        # Walkable tiles are the ones the collision mask leaves free.
+        # Door distance fields are computed here, once per map, and shared by every day's route
+        self.nav = NavGrid(self.collision_mask)
+        doors = {door.name: self.nav.tile_at(door.hitbox.center) for door in self.interaction_sprites}
+        self.route_planner = RoutePlanner(self.nav, doors)
+
+    def delivery_route(self):
+        # Doors still waiting for a package, in visiting order from the player's tile, and the tiles to walk.
+        # Re-planned whenever the player's tile or the pending doors change, e.g. after a delivery
+        pending = [name for name, state in self.door_states.items()
+                   if state['package_assigned'] and not state['delivered']]
+        return self.route_planner.route(self.nav.tile_at(self.player.hitbox.center), pending)
 
     def assign_packages_to_doors(self, tmx_data):
         if self.doors_assigned:
@@ -150,7 +218,7 @@ class Level:
 
         # Ensure that the number of assigned packages doesn't exceed player's inventory or the total number of doors
         assigned_packages = min(player_packages, total_doors)
-        assigned_indices = set(random.sample(range(total_doors), assigned_packages))
+        assigned_indices = set(self.random.sample(range(total_doors), assigned_packages))
 
         self.door_states = {}
 
@@ -168,75 +236,68 @@ class Level:
 
         self.doors_assigned = True  # Mark doors as assigned
 
-    def display_inventory(self):
+    def create_hud(self):
+        self.hud = Hud(self.display_surface)
+
         font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
-        font = pygame.font.Font(font_path, 18) if os.path.isfile(font_path) else pygame.font.SysFont("Arial", 18)
+        font = assets.font(font_path, 18) if os.path.isfile(font_path) else pygame.font.SysFont("Arial", 18)
 
+        # Inventory box, the text re-renders only when the package count changes
         box_path = os.path.join(os.path.dirname(__file__), "../graphics/ui/box.png")
-        box_image = pygame.image.load(box_path).convert_alpha()
-        box_resized = pygame.transform.scale(box_image, (250, 70))
-        box_position = (20, 20)
-        self.display_surface.blit(box_resized, box_position)
-
-        package_text = f'Packages: {self.player.inventory["packages"]}'
-        text_surf = font.render(package_text, True, GREY)
-        text_rect = text_surf.get_rect(center=(box_position[0] + box_resized.get_width() // 2,
-                                               box_position[1] + box_resized.get_height() // 2))
-        self.display_surface.blit(text_surf, text_rect)
-
-    def handle_interactions(self):
-        keys = pygame.key.get_pressed()  # Get the current state of all keys
-        for sprite in self.interaction_sprites:
-            if self.player.rect.colliderect(sprite.hitbox):  # Check if player is within the door hitbox
-                # Check door states (whether package is assigned or delivered)
-                door_state = self.door_states.get(sprite.name)
-
-                if keys[pygame.K_f] and not getattr(self, 'interaction_occurred', False):
-                    # Only interact if the key is pressed and the interaction hasn't already occurred
-                    if door_state is None:
-                        print(f"Error: Door {sprite.name} not found in door_states!") 
-                        continue  # Exit this interaction if door doesn't exist
-
-                    # Check interaction with the door
-                    if door_state['package_assigned']:
-                        if not door_state['delivered']:  # If the package hasn't been delivered yet
-                            # Decrease the package count before activating the dialogue
-                            self.player.inventory["packages"] -= 1
-                            
-                            # Show "Package delivered!" message
-                            self.dialogue_box.activate("Package delivered!")
-                            self.dialogue_active = True  # Dialogue box is active
-                            
-                            # Mark the door to update after the dialogue box closes
-                            self.door_state_to_update = sprite.name  # Set the flag for delayed update
-                            
-                            # Set the delivered flag for this interaction
-                            self.package_delivered = True
-                            self.interaction_occurred = True  # Mark the interaction as occurred
-                        else:
-                            self.dialogue_box.activate("Package already delivered!")
-                            self.dialogue_active = True
-                    else:
-                        # No package assigned
-                        self.dialogue_box.activate("Wrong house!")
-                        self.dialogue_active = True
-
-            # Once the dialogue box closes, update the door state and reset the interaction flag
-            if not self.dialogue_active and hasattr(self, 'door_state_to_update'):
-                door_name = self.door_state_to_update
-                door_state = self.door_states.get(door_name)
-                if door_state is not None:
-                    door_state['delivered'] = True  # Mark as delivered after dialogue box closes
-                    delattr(self, 'door_state_to_update')  # Reset the flag
-                    delattr(self, 'package_delivered')  # Reset the package delivered flag
-                    delattr(self, 'interaction_occurred')  # Reset the interaction flag
-
-    def toggle_dialogue_box(self, text=""):
-        self.dialogue_active = not self.dialogue_active
-        if self.dialogue_active:
-            self.dialogue_box.activate(text)
-        else:
+        box = self.hud.add(ImageWidget(assets.image(box_path), (250, 70), topleft=(20, 20)))
+        self.hud.add(TextWidget(font, lambda: self.player.inventory['packages'], GREY, 'Packages: {}',
+                                center=box.rect.center))
+
+    def display_inventory(self):
+        self.hud.draw()
+
+    def handle_interactions(self, inputs):
+        # Route this frame's key presses to the actions subscribed in __init__
+        self.controls.dispatch(inputs)
+
+    def interact(self):
+        if self.map_active or self.dialogue_active:
+            return
+
+        # Only the doors in the cells around the player are checked
+        for sprite in self.door_grid.query(self.player.rect):  # Player is within the door hitbox
+            # Check door states (whether package is assigned or delivered)
+            door_state = self.door_states.get(sprite.name)
+            if door_state is None:
+                print(f"Error: Door {sprite.name} not found in door_states!")
+                continue
+
+            # Check interaction with the door
+            if door_state['package_assigned']:
+                if not door_state['delivered']:  # If the package hasn't been delivered yet
+                    # Decrease the package count before activating the dialogue
+                    self.player.inventory["packages"] -= 1
+
+                    # Show "Package delivered!" message
+                    self.dialogue_box.activate("Package delivered!")
+
+                    # Mark the door to update after the dialogue box closes
+                    self.door_state_to_update = sprite.name
+                else:
+                    self.dialogue_box.activate("Package already delivered!")
+            else:
+                # No package assigned
+                self.dialogue_box.activate("Wrong house!")
+            self.dialogue_active = True
+            return
+
+    def close_overlay(self):
+        if self.map_active:
+            self.toggle_map()
+        elif self.dialogue_active:
             self.dialogue_box.deactivate()
+            self.dialogue_active = False
+
+            # Once the dialogue box closes, update the door state
+            door_state = self.door_states.get(self.door_state_to_update)
+            if door_state is not None:
+                door_state['delivered'] = True  # Mark as delivered after dialogue box closes
+            self.door_state_to_update = None
 
     def toggle_map(self):
         if not self.dialogue_box.active:
@@ -244,47 +305,161 @@ class Level:
 
     def reset(self):
         # print("Level reset triggered!")  # DEBUG
+        # New day: the static world, collision index and doors are kept, only dynamic state is reset
         self.sky.reset()
-        self.setup()
-        self.player.inventory['packages'] = random.randint(7, 12)
+        self.rain.clear()
+        self.player.respawn(self.player_start)
+        self.player.inventory['packages'] = self.random.randint(7, 12)
+        self.day += 1
+
+        # Drop any delivery still waiting for its dialogue to close, it belongs to the previous day
+        self.door_state_to_update = None
+
         self.doors_assigned = False #allows new assignments
         self.assign_packages_to_doors(self.tmx_data)
 
-    def run(self, dt):
-        # Drawing logic
-        self.display_surface.fill('black')
-        self.all_sprites.custom_draw(self.player)
+    def step(self, dt, inputs):
+        # One tick of game logic, without drawing. inputs is the frame's InputState (live, replayed
+        # or scripted): pressed keys fire the subscribed actions, held keys move the player
+        profiler.count('steps')
+        headless = self.headless
 
-        # Updates
-        if self.map_active:
-            self.map.update()
-        elif self.dialogue_active:
-            self.dialogue_box.update()
-            if pygame.key.get_pressed()[pygame.K_ESCAPE]:
-                self.dialogue_box.deactivate()
-                self.dialogue_active = False
-        else:
-            self.all_sprites.update(dt)
+        # Where moving things start from, drawing can interpolate from there (see interpolated)
+        if not headless:
+            self.player.previous_center = self.player.rect.center
+            self.couriers.previous_pos[:] = self.couriers.pos
 
         # Interaction
-        self.handle_interactions()
-
-        # Rain
-        if self.raining and not self.map_active and not self.dialogue_active:
-            self.rain.update()
+        with profiler.stage('interactions'):
+            self.handle_interactions(inputs)
+
+        # Updates (the typewriter text and the water animation only show on screen)
+        with profiler.stage('update'):
+            if self.dialogue_active:
+                if not headless:
+                    self.dialogue_box.update(dt)
+            elif not self.map_active:
+                if not headless:
+                    self.water_clock.update(dt)
+                self.all_sprites.update(dt, inputs)
+
+        # Couriers, every step or in courier_step chunks of time
+        with profiler.stage('couriers'):
+            if not self.map_active and not self.dialogue_active:
+                self.courier_time += dt
+                if self.courier_time >= self.courier_step:
+                    self.couriers.update(self.courier_time)
+                    self.courier_time = 0
+
+        # Rain, particles only
+        with profiler.stage('rain'):
+            if self.raining and not headless and not self.map_active and not self.dialogue_active:
+                self.rain.update(dt, self.player.rect.center)
 
         # Daytime
-        self.sky.display(dt)
+        with profiler.stage('sky'):
+            self.sky.display(dt)
 
         # Transition
-        self.transition.play(dt)
+        with profiler.stage('transition'):
+            self.transition.play(dt)
+
+        # World streaming: chunks around where the player ended up (a new day moves it back to the start)
+        with profiler.stage('world'):
+            self.world.update(self.player.rect.center, self.player.direction)
+
+    def invalidate(self, rect=None):
+        #marks a screen area (or everything) to be redrawn by the dirty rect renderer next frame
+        if self.dirty is not None:
+            if rect is None:
+                self.dirty.invalidate()
+            else:
+                self.dirty.add(rect)
+
+    def changed_rects(self):
+        # Screen areas to redraw, None for a full frame: the camera moved, the tint or fade changed, an overlay
+        # opened or closed, or the rain is falling. Otherwise whatever sprites, couriers, HUD widgets and the dialogue changed
+        offset = self.all_sprites.update_offset(self.player)
+        color = self.compositor.combine(self.sky.color, self.transition.fade)
+        state = (offset, color, self.transition.state, self.map_active, self.dialogue_active)
+        world_running = not self.map_active and not self.dialogue_active
+        if state != self.drawn_state or (world_running and self.raining):
+            self.dirty.invalidate()
+        self.drawn_state = state
+
+        for rect in self.all_sprites.changed_rects():
+            self.dirty.add(rect.move(-offset[0], -offset[1]))
+        for rect in self.couriers.changed_rects(pygame.Rect(offset, (SCREEN_WIDTH, SCREEN_HEIGHT)), offset):
+            self.dirty.add(rect)
+        for rect in self.hud.changed_rects():
+            self.dirty.add(rect)
+        if self.dialogue_active:
+            self.dirty.add(self.dialogue_box.box_rect) #the text types itself out
+        return self.dirty.take()
+
+    @contextmanager
+    def interpolated(self, alpha):
+        # Moving things put alpha of the way from where their last step started to where it ended, for drawing
+        player = self.player
+        center = player.rect.center
+        if alpha < 1:
+            x, y = player.previous_center
+            player.rect.center = (round(x + (center[0] - x) * alpha), round(y + (center[1] - y) * alpha))
+        self.couriers.alpha = alpha
+        try:
+            yield
+        finally:
+            player.rect.center = center
+            self.couriers.alpha = 1
+
+    def draw(self, alpha=1):
+        # Returns the screen areas drawn this frame (for pygame.display.update), None for the whole screen.
+        # alpha below 1 draws between the last two steps (see FixedTimestep)
+        with self.interpolated(alpha):
+            if self.dirty is None:
+                self.draw_frame()
+                return None
+
+            with profiler.stage('draw'):
+                rects = self.changed_rects()
+            if rects is None:
+                self.draw_frame()
+            else:
+                for rect in rects:
+                    self.display_surface.set_clip(rect)
+                    self.draw_frame(rect)
+                self.display_surface.set_clip(None)
+            return rects
+
+    def draw_frame(self, area=None):
+        # The whole frame, or only what falls inside area (a screen rect, also set as the clip by draw)
+        with profiler.stage('draw'):
+            self.display_surface.fill('black')
+            self.all_sprites.custom_draw(self.player, area)
+
+            # Map
+            if self.map_active:
+                self.map.draw_map_box()
+
+        # Sky tint and transition fade, composited in at most one pass
+        with profiler.stage('sky'):
+            self.compositor.apply(self.sky.color, self.transition.fade)
+
+        with profiler.stage('transition'):
+            self.transition.draw_transition()
 
         # Inventory
-        self.display_inventory()
+        with profiler.stage('hud'):
+            self.display_inventory()
 
         # Dialogue
-        if self.dialogue_active:
-            self.dialogue_box.render()
+        with profiler.stage('dialogue'):
+            if self.dialogue_active:
+                self.dialogue_box.render()
+
+    def run(self, dt, inputs):
+        self.step(dt, inputs)
+        return self.draw()
 
 class CameraGroup(pygame.sprite.Group):
     def __init__(self, level_width, level_height):
@@ -294,16 +469,186 @@ class CameraGroup(pygame.sprite.Group):
         self.level_width = level_width
         self.level_height = level_height
 
-    def custom_draw(self, player):
+        # Draw list: one spatially indexed bucket per z-layer, filled as sprites join or leave the group
+        self.layers = {layer: SpatialGrid() for layer in LAYERS.values() if layer != LAYERS['main']}
+        self.pending = {}  # sprites added since the last draw (z may not be set yet)
+        self.updating = {}  # sprites with their own update method
+
+        # Callables drawing batched effects (e.g. rain) right after a layer's sprites
+        self.painters = {layer: [] for layer in LAYERS.values()}
+        # Callables returning (sort y, image, screen pos) for things that aren't sprites (e.g. couriers),
+        # drawn in y order among the layer's sprites
+        self.batches = {layer: [] for layer in LAYERS.values()}
+
+        # Only the main layer is y-sorted, keyed on (rect.centery, insertion order) and kept in order as sprites
+        # join, leave or move. The other layers draw in grid order: their sprites (ground, water) never overlap
+        self.sorted_keys = []
+        self.sorted_sprites = []
+        self.sort_keys = {}
+        self.reach = 0  # furthest any main layer sprite sticks out above or below its centery
+        self.moving_sprites = set()  # sprites that can change position
+        self.large_sprites = set()  # sprites bigger than the screen, blitted by visible area only
+        self.animated_sprites = set()  # sprites whose image changes without them moving (e.g. water)
+        self.insert_count = 0
+
+        # Change tracking for the dirty rect renderer, off unless the level turns it on
+        self.track_changes = False
+        self.drawn = {}  # moving or animated sprite -> (image, rect) when last reported
+        self.added = []
+        self.removed_rects = []
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.pending[sprite] = None
+        if self.track_changes:
+            self.added.append(sprite)
+        if type(sprite).update is not pygame.sprite.Sprite.update:
+            self.updating[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.updating.pop(sprite, None)
+        if self.track_changes:
+            drawn = self.drawn.pop(sprite, None)
+            self.removed_rects.append(drawn[1] if drawn else sprite.rect.copy())
+        if sprite in self.pending:
+            del self.pending[sprite]
+        else:
+            self.unbucket(sprite)
+
+    def update(self, *args, **kwargs):
+        # Only sprites that define their own update are visited (static tiles are skipped)
+        for sprite in list(self.updating):
+            sprite.update(*args, **kwargs)
+
+    def add_painter(self, layer, painter):
+        self.painters[layer].append(painter)
+
+    def add_batch(self, layer, source):
+        self.batches[layer].append(source)
+
+    def bucket(self, sprite):
+        if sprite.z == LAYERS['main']:
+            order = getattr(sprite, 'draw_order', None)  # world chunks bring their own, whenever they load
+            if order is None:
+                order = self.insert_count
+                self.insert_count += 1
+            self.insert_sorted(sprite, (sprite.rect.centery, order))
+            self.reach = max(self.reach, sprite.rect.height - sprite.rect.height // 2)
+        else:
+            self.layers.setdefault(sprite.z, SpatialGrid()).insert(sprite)
+        if not getattr(sprite, 'static', False):
+            self.moving_sprites.add(sprite)
+        if sprite.rect.width > SCREEN_WIDTH or sprite.rect.height > SCREEN_HEIGHT:
+            self.large_sprites.add(sprite)
+        if getattr(sprite, 'animated', False):
+            self.animated_sprites.add(sprite)
+
+    def unbucket(self, sprite):
+        if sprite in self.sort_keys:
+            self.remove_sorted(sprite)
+        else:
+            self.layers[sprite.z].remove(sprite)
+        self.moving_sprites.discard(sprite)
+        self.large_sprites.discard(sprite)
+        self.animated_sprites.discard(sprite)
+
+    def insert_sorted(self, sprite, key):
+        index = bisect_left(self.sorted_keys, key)
+        self.sorted_keys.insert(index, key)
+        self.sorted_sprites.insert(index, sprite)
+        self.sort_keys[sprite] = key
+
+    def remove_sorted(self, sprite):
+        # Keys are unique thanks to the insertion counter (or the chunk draw order), so bisect lands on the sprite
+        index = bisect_left(self.sorted_keys, self.sort_keys.pop(sprite))
+        del self.sorted_keys[index]
+        del self.sorted_sprites[index]
+
+    def refresh_draw_list(self):
+        for sprite in self.pending:
+            self.bucket(sprite)
+        self.pending.clear()
+
+        # Re-sort or re-index only the sprites that actually moved since the last frame
+        for sprite in self.moving_sprites:
+            key = self.sort_keys.get(sprite)
+            if key is None:
+                self.layers[sprite.z].move(sprite)
+            elif sprite.rect.centery != key[0]:
+                self.remove_sorted(sprite)
+                self.insert_sorted(sprite, (sprite.rect.centery, key[1]))
+
+    def visible_sorted(self, view):
+        #main layer sprites inside view, in draw order: the sorted run whose centery can reach the view, filtered
+        start = bisect_left(self.sorted_keys, (view.top - self.reach,))
+        end = bisect_left(self.sorted_keys, (view.bottom + self.reach + 1,))
+        return [sprite for sprite in self.sorted_sprites[start:end] if sprite.rect.colliderect(view)]
+
+    def changed_rects(self):
+        # World rects whose pixels changed since the last call: sprites that joined or left,
+        # and moving or animated ones that moved or show another image (both places)
+        self.refresh_draw_list()
+        rects = self.removed_rects
+        self.removed_rects = []
+
+        for sprite in self.added:
+            if self.has_internal(sprite):
+                rects.append(sprite.rect.copy())
+        self.added.clear()
+
+        for watched in (self.moving_sprites, self.animated_sprites):
+            for sprite in watched:
+                drawn = self.drawn.get(sprite)
+                if drawn is None or drawn[0] is not sprite.image or drawn[1] != sprite.rect:
+                    if drawn is not None:
+                        rects.append(drawn[1])
+                    rects.append(sprite.rect.copy())
+                    self.drawn[sprite] = (sprite.image, sprite.rect.copy())
+        return rects
+
+    def update_offset(self, player):
+        #centres the camera on the player, inside the level, and returns the offset in whole pixels
         self.offset.x = player.rect.centerx - SCREEN_WIDTH / 2
         self.offset.y = player.rect.centery - SCREEN_HEIGHT / 2
 
         self.offset.x = max(0, min(self.offset.x, self.level_width - SCREEN_WIDTH))
         self.offset.y = max(0, min(self.offset.y, self.level_height - SCREEN_HEIGHT))
+        return int(self.offset.x), int(self.offset.y)
+
+    def custom_draw(self, player, region=None):
+        # region limits drawing to part of the screen (dirty rect rendering), the whole view otherwise
+        offset_x, offset_y = self.update_offset(player)
+        self.refresh_draw_list()
 
+        view = pygame.Rect(offset_x, offset_y, SCREEN_WIDTH, SCREEN_HEIGHT)
+        if region is not None:
+            view = region.move(offset_x, offset_y)
+        blit = self.display_surface.blit
         for layer in LAYERS.values():
-            for sprite in sorted(self.sprites(), key=lambda sprite: sprite.rect.centery):
-                if sprite.z == layer:
-                    offset_rect = sprite.rect.copy()
-                    offset_rect.center -= self.offset
-                    self.display_surface.blit(sprite.image, offset_rect)
+            sorted_layer = layer == LAYERS['main']
+            visible = self.visible_sorted(view) if sorted_layer else self.layers[layer].query(view)
+            # Batched items go in before the first sprite sorting after them (after sprites on a tie),
+            # on unsorted layers after all the sprites
+            batched = sorted((item for source in self.batches[layer] for item in source(view, (offset_x, offset_y))),
+                             key=itemgetter(0))
+            index = 0
+            for sprite in visible:
+                if sorted_layer and index < len(batched):
+                    sort_y = sprite.rect.centery
+                    while index < len(batched) and batched[index][0] < sort_y:
+                        blit(batched[index][1], batched[index][2])
+                        index += 1
+                rect = sprite.rect
+                if sprite in self.large_sprites:
+                    # Only blit the part of the source that is on screen
+                    area = view.clip(rect)
+                    blit(sprite.image, (area.x - offset_x, area.y - offset_y), area.move(-rect.x, -rect.y))
+                else:
+                    blit(sprite.image, (rect.x - offset_x, rect.y - offset_y))
+            profiler.count('blits', len(visible))
+            for _, image, pos in batched[index:]:
+                blit(image, pos)
+
+            for painter in self.painters[layer]:
+                painter(self.display_surface, (offset_x, offset_y))
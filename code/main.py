@@ -1,6 +1,10 @@
-import pygame, sys, os
+import pygame, sys, os, argparse, random
 from settings import *
 from level import Level
+from profiler import profiler
+from inputs import InputDispatcher, InputRecorder, InputReplay
+from preload import Preloader, LoadingScreen
+from timestep import FixedTimestep
 
 # Automate deletion of tempCodeRunnerFile.py
 temp_file = "tempCodeRunnerFile.py"
@@ -9,25 +13,103 @@ if os.path.exists(temp_file):
     # print(f"Removed {temp_file}")
 
 class Game:
-	def __init__(self):
+	def __init__(self, seed=None, record=None, replay=None, uncapped=False, dirty_rects=DIRTY_RECTS, fixed_timestep=FIXED_TIMESTEP):
 		pygame.init()
 		self.screen = pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
 		pygame.display.set_caption("Angel's Message")
 		self.clock = pygame.time.Clock()
-		self.level = Level(self.screen)
+
+		# A replay brings its own seed, so the level rolls the same doors, packages and rain
+		self.replay = InputReplay(replay) if replay else None
+		if self.replay:
+			seed = self.replay.seed
+		elif seed is None:
+			seed = random.getrandbits(32)
+		self.seed = seed
+		# The level is built once the preloader is done, behind a loading screen (see load)
+		self.preloader = Preloader()
+		self.loading_screen = LoadingScreen(self.screen)
+		self.level = None
+		self.recorder = InputRecorder(record, seed) if record else None
+		self.uncapped = uncapped
+		self.dirty_rects = dirty_rects
+		self.fixed_timestep = fixed_timestep
+		self.timestep = None
+
+		# The event queue is drained once per frame, here; gameplay keys reach the level as a frame snapshot
+		self.events = InputDispatcher()
+		self.events.subscribe(None, self.quit, pygame.QUIT)
+		self.events.subscribe(PROFILER_KEY, profiler.toggle)
+
+	def quit(self):
+		if self.recorder:
+			self.recorder.close()
+		profiler.stop_export()
+		pygame.display.quit()
+		pygame.quit()
+		sys.exit()
+
+	def load(self):
+		# The level is built in stages after the assets, one or more per loading screen frame, so the bar
+		# only fills up once it is ready. Only quitting is handled while loading, key presses stay queued for the first frame
+		level = Level(self.screen, self.seed, self.dirty_rects, staged=True)
+		for stage in level.build_stages:
+			self.preloader.add_stage(stage)
+		while not self.preloader.done:
+			if pygame.event.get(pygame.QUIT):
+				self.quit()
+			self.loading_screen.draw(self.preloader.poll())
+			pygame.display.update()
+			self.clock.tick(FPS)
+		self.level = level
+		if self.fixed_timestep:
+			self.timestep = FixedTimestep(self.level)
+		self.clock.tick()
 
 	def run(self):
+		if self.level is None:
+			self.load()
 		while True:
-			for event in pygame.event.get():
-				if event.type == pygame.QUIT:
-					pygame.display.quit()
-					pygame.quit()
-					sys.exit()
-
-			dt = self.clock.tick(FPS) / 1000
-			self.level.run(dt)
-			pygame.display.update()
+			inputs = self.events.pump()
+
+			if self.replay:
+				if self.replay.done:
+					self.quit()
+				dt, inputs = self.replay.next()
+				# Real speed waits out each recorded frame time, uncapped runs as fast as it can
+				self.clock.tick(0 if self.uncapped else 1 / max(dt, 1e-6))
+			else:
+				dt = self.clock.tick(0 if self.uncapped else FPS) / 1000
+				if self.recorder:
+					dt = self.recorder.record(dt, inputs)
+
+			profiler.begin_frame()
+			if profiler.drawn_rect:
+				self.level.invalidate(profiler.drawn_rect) #the overlay is see-through, what is under it is redrawn first
+			if self.timestep:
+				rects = self.timestep.run(dt, inputs)
+			else:
+				rects = self.level.run(dt, inputs)
+			profiler.end_frame()
+			profiler.draw(self.screen)
+			if rects is not None and profiler.drawn_rect:
+				rects.append(profiler.drawn_rect)
+			pygame.display.update(rects)
 
 if __name__ == '__main__':
-	game = Game()
-	game.run()
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="Angel's Message")
+	parser.add_argument('--profile-log', metavar='PATH', help='stream per-frame stage timings to a .csv or .jsonl file')
+	parser.add_argument('--seed', type=int, help='seed for every random roll (default: a new one each run)')
+	parser.add_argument('--record', metavar='PATH', help='record the seed, frame times and key states to a binary log')
+	parser.add_argument('--replay', metavar='PATH', help='play back a recorded log instead of reading the keyboard')
+	parser.add_argument('--uncapped', action='store_true', help='do not wait for the frame rate (or the recorded frame times)')
+	parser.add_argument('--fixed-timestep', action='store_true', default=FIXED_TIMESTEP, help='simulate in fixed steps and draw in between them (replay recordings with the same setting)')
+	parser.add_argument('--dirty-rects', action='store_true', default=DIRTY_RECTS, help='redraw and present only the parts of the screen that changed')
+	args = parser.parse_args()
+	if args.record and args.replay:
+		parser.error('--record and --replay cannot be combined')
+
+	game = Game(args.seed, args.record, args.replay, args.uncapped, args.dirty_rects, args.fixed_timestep)
+	if args.profile_log:
+		profiler.start_export(args.profile_log)
+	game.run()
@@ -1,17 +1,19 @@
-import pygame, os
-from pytmx.util_pygame import load_pygame
+import pygame
 from settings import *
+from profiler import profiler
 
 class Map:
-    def __init__(self, player, toggle_map):
+    def __init__(self, player, tmx_data, get_door_states, get_route):
         # General setup
         self.player = player
-        self.toggle_map = toggle_map
+        self.get_door_states = get_door_states
+        self.get_route = get_route
+        self.route_tiles = None
+        self.route_points = []
         self.display_surface = pygame.display.get_surface()
 
-        # Load map
-        tmx_path = os.path.join(os.path.dirname(__file__), "../data/map.tmx")
-        self.tmx_data = load_pygame(tmx_path)
+        # Map data is shared with Level instead of parsing map.tmx again
+        self.tmx_data = tmx_data
 
         # Set up map box dimensions
         self.box_width = 750
@@ -19,26 +21,40 @@ class Map:
         self.box_surface = pygame.Surface((self.box_width, self.box_height))
         self.box_rect = self.box_surface.get_rect(center=self.display_surface.get_rect().center)
 
-    def draw_map_box(self):
         # Calculate scaling factor to fit the map
         map_width = self.tmx_data.width * TILE_SIZE
         map_height = self.tmx_data.height * TILE_SIZE
+        self.scale_factor = min(self.box_width / map_width, self.box_height / map_height)
+
+        # Door positions for the live overlay
+        self.doors = {}
+        for obj in self.tmx_data.get_layer_by_name('Player'):
+            if obj.name.startswith('Door'):
+                self.doors[obj.name] = self.to_map((obj.x + obj.width / 2, obj.y + obj.height / 2))
+
+        # The static part of the map is rendered only once
+        self.render_map_box()
 
-        scale_x = self.box_width / map_width
-        scale_y = self.box_height / map_height
-        scale_factor = min(scale_x, scale_y)
+    def to_map(self, pos):
+        return (self.box_rect.left + int(pos[0] * self.scale_factor),
+                self.box_rect.top + int(pos[1] * self.scale_factor))
+
+    def render_map_box(self):
+        scale_factor = self.scale_factor
+        scaled_tile_size = int(TILE_SIZE * scale_factor)
+        scaled_tiles = {}
 
         # Draw tile layers
         for layer in self.tmx_data.visible_layers:
             if hasattr(layer, 'data'):  # Tile layers
                 for x, y, gid in layer:
-                    tile = self.tmx_data.get_tile_image_by_gid(gid)
-                    if tile:
-                        scaled_tile_size = int(TILE_SIZE * scale_factor)
-                        tile_x = int(x * scaled_tile_size)
-                        tile_y = int(y * scaled_tile_size)
-                        scaled_tile = pygame.transform.scale(tile, (scaled_tile_size, scaled_tile_size))
-                        self.box_surface.blit(scaled_tile, (tile_x, tile_y))
+                    if gid not in scaled_tiles:
+                        tile = self.tmx_data.get_tile_image_by_gid(gid)
+                        scaled_tiles[gid] = pygame.transform.scale(tile, (scaled_tile_size, scaled_tile_size)) if tile else None
+
+                    scaled_tile = scaled_tiles[gid]
+                    if scaled_tile:
+                        self.box_surface.blit(scaled_tile, (int(x * scaled_tile_size), int(y * scaled_tile_size)))
 
         # Draw object layers
         for obj in self.tmx_data.objects:
@@ -52,20 +68,31 @@ class Map:
             if obj.image:
                 scaled_image = pygame.transform.scale(obj.image, (scaled_width, scaled_height))
                 self.box_surface.blit(scaled_image, (scaled_x, scaled_y))
-        
+
         # Draw a border around the map box
         border_thickness = 5
         border_color = WHITE
         pygame.draw.rect(self.box_surface, border_color, self.box_surface.get_rect(), border_thickness)
 
-        # Blit the map box onto the display
-        self.display_surface.blit(self.box_surface, self.box_rect.topleft)
+    def draw_overlays(self):
+        # Path hint along the planned delivery route, converted again only when the route changed
+        _, tiles = self.get_route()
+        if tiles is not self.route_tiles:
+            self.route_tiles = tiles
+            self.route_points = [self.to_map(((x + 0.5) * TILE_SIZE, (y + 0.5) * TILE_SIZE)) for x, y in tiles]
+        if len(self.route_points) > 1:
+            pygame.draw.lines(self.display_surface, BLUE, False, self.route_points, 2)
+
+        # Doors that still expect a package, and the ones already delivered
+        for name, state in self.get_door_states().items():
+            if state['package_assigned']:
+                color = GREEN if state['delivered'] else YELLOW
+                pygame.draw.circle(self.display_surface, color, self.doors[name], 5)
 
-    def input(self):
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_ESCAPE]:
-            self.toggle_map()
+        pygame.draw.circle(self.display_surface, RED, self.to_map(self.player.rect.center), 6)
 
-    def update(self):
-        self.input()
-        self.draw_map_box()
+    def draw_map_box(self):
+        # Blit the cached map box and draw the live overlays on top
+        self.display_surface.blit(self.box_surface, self.box_rect.topleft)
+        profiler.count('blits')
+        self.draw_overlays()
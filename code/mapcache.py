@@ -0,0 +1,288 @@
+import os, json, mmap, struct
+from array import array
+from itertools import chain
+import xml.etree.ElementTree as ElementTree
+import pygame
+from settings import *
+from atlas import pack_surfaces
+from freshness import source_record, check_sources
+from problems import report
+
+#cache layout: header, JSON index, then the buffers it points to (tile GID arrays, the packed tileset as raw RGBA)
+CACHE_MAGIC = b'AMMP'
+CACHE_VERSION = 1
+HEADER = struct.Struct('<4sHI') #magic, version, length of the JSON index
+
+def cache_path(path):
+    return os.path.join(CACHE_DIR, os.path.basename(path) + '.bin')
+
+def map_sources(path):
+    # The TMX and every file it pulls in: external tilesets (.tsx) and the images they (or the map) use
+    sources = [path]
+    root = ElementTree.parse(path).getroot()
+    for image in root.iter('image'):
+        sources.append(os.path.join(os.path.dirname(path), image.get('source')))
+    for tileset in root.iter('tileset'):
+        if tileset.get('source'):
+            tsx_path = os.path.normpath(os.path.join(os.path.dirname(path), tileset.get('source')))
+            sources.append(tsx_path)
+            for image in ElementTree.parse(tsx_path).getroot().iter('image'):
+                sources.append(os.path.normpath(os.path.join(os.path.dirname(tsx_path), image.get('source'))))
+    return sources
+
+def compile_map(path):
+    # Parses the TMX once through pytmx and returns the cache file contents
+    import pytmx #only needed to compile, a warm start never imports it
+    from pytmx.util_pygame import load_pygame
+    tmx_data = load_pygame(path)
+    folder = os.path.dirname(path)
+    buffers = []
+    size = 0
+
+    def add_buffer(data):
+        nonlocal size
+        offset = size
+        buffers.append(data)
+        size += len(data)
+        padding = -size % 4
+        buffers.append(bytes(padding))
+        size += padding
+        return {'offset': offset, 'length': len(data)}
+
+    # Images keep pytmx's indices (so GIDs stay valid), object images pytmx doesn't share are added at the end
+    images = list(tmx_data.images)
+    image_index = {id(image): i for i, image in enumerate(images) if image is not None}
+    for obj in tmx_data.objects:
+        if obj.image is not None and id(obj.image) not in image_index:
+            image_index[id(obj.image)] = len(images)
+            images.append(obj.image)
+
+    packed = [i for i, image in enumerate(images) if image is not None]
+    atlas, rects = pack_surfaces([images[i] for i in packed])
+    image_rects = [None] * len(images)
+    for i, rect in zip(packed, rects):
+        image_rects[i] = list(rect)
+
+    layers = []
+    for layer in tmx_data.layers:
+        record = {'name': layer.name, 'visible': layer.visible, 'opacity': getattr(layer, 'opacity', 1),
+                  'properties': getattr(layer, 'properties', {})}
+        if isinstance(layer, pytmx.TiledTileLayer):
+            gids = array('H' if len(images) < 0x10000 else 'I', chain.from_iterable(layer.data))
+            record.update(kind='tiles', width=layer.width, height=layer.height,
+                          gids=dict(add_buffer(gids.tobytes()), typecode=gids.typecode))
+        elif isinstance(layer, pytmx.TiledObjectGroup):
+            record.update(kind='objects', objects=[{
+                'id': obj.id, 'name': obj.name, 'type': obj.type, 'x': obj.x, 'y': obj.y,
+                'width': obj.width, 'height': obj.height, 'rotation': obj.rotation, 'visible': obj.visible,
+                'image': image_index[id(obj.image)] if obj.image is not None else None,
+                'properties': obj.properties,
+            } for obj in layer])
+        else:
+            record.update(kind='group')
+        layers.append(record)
+
+    index = {
+        'sources': [],
+        'width': tmx_data.width, 'height': tmx_data.height,
+        'tilewidth': tmx_data.tilewidth, 'tileheight': tmx_data.tileheight,
+        'atlas': dict(add_buffer(pygame.image.tobytes(atlas, 'RGBA')), size=atlas.get_size()),
+        'images': image_rects,
+        'layers': layers,
+    }
+    for source in map_sources(path):
+        index['sources'].append(source_record(folder, source))
+    return pack_cache(index, b''.join(buffers))
+
+def pack_cache(index, buffers):
+    index_data = json.dumps(index, default=str).encode()
+    return HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(index_data)) + index_data + buffers
+
+def read_index(data):
+    if len(data) < HEADER.size:
+        return None
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    index = json.loads(data[HEADER.size:HEADER.size + length])
+    index['base'] = HEADER.size + length
+    return index
+
+def load_map(path):
+    # A CachedMap from the compiled cache, recompiled first when it is missing, stale or from another version
+    path = os.path.abspath(path)
+    if not MAP_CACHE:
+        from pytmx.util_pygame import load_pygame
+        return load_pygame(path)
+
+    fresh = False
+    try:
+        with open(cache_path(path), 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            index = read_index(data)
+            if index is not None:
+                fresh, touched = check_sources(os.path.dirname(path), index['sources'])
+                if fresh and not touched:
+                    return CachedMap(index, data)
+                if fresh:
+                    data = data[:] #a copy, the file gets replaced once the mapping is closed
+    except (OSError, ValueError):
+        pass #no cache yet (or an empty file)
+    return CachedMap(*(refresh_cache(path, index, data) if fresh else compile_cache(path)))
+
+def read_map(path):
+    # (index, data) of the compiled cache, like load_map but without building the CachedMap, whose tileset
+    # has to be converted on the main thread. Reads, compiles and writes files only, so the preloader runs it on a worker
+    path = os.path.abspath(path)
+    try:
+        with open(cache_path(path), 'rb') as file:
+            data = file.read()
+        index = read_index(data)
+        if index is not None:
+            fresh, touched = check_sources(os.path.dirname(path), index['sources'])
+            if fresh:
+                return refresh_cache(path, index, data) if touched else (index, data)
+    except (OSError, ValueError):
+        pass #no cache yet (or an empty file)
+    return compile_cache(path)
+
+def refresh_cache(path, index, data):
+    # Sources that were only touched: the same cache with their new modification times in its index, written
+    # back so the next launch doesn't hash them again. Returns (index, data) like read_map
+    base = index.pop('base')
+    data = pack_cache(index, data[base:])
+    write_cache(path, data)
+    return read_index(data), data
+
+def compile_cache(path):
+    #compiles the map and writes the cache, returns (index, data)
+    data = compile_map(path)
+    write_cache(path, data)
+    return read_index(data), data
+
+def write_cache(path, data):
+    target = cache_path(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(target + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(target + '.tmp', target)
+    except OSError as error:
+        report(f"Warning: could not write the map cache {target}: {error}")
+
+class CachedMap:
+    # The parts of pytmx's TiledMap the game uses, read from the cache
+    def __init__(self, index, data):
+        base = index['base']
+        self.width = index['width']
+        self.height = index['height']
+        self.tilewidth = index['tilewidth']
+        self.tileheight = index['tileheight']
+
+        atlas = index['atlas']
+        start = base + atlas['offset']
+        self.atlas = pygame.image.frombytes(data[start:start + atlas['length']], atlas['size'], 'RGBA').convert_alpha()
+        self.images = [self.atlas.subsurface(rect) if rect else None for rect in index['images']]
+
+        self.layers = []
+        self.layernames = {}
+        for record in index['layers']:
+            if record['kind'] == 'tiles':
+                gids = record['gids']
+                start = base + gids['offset']
+                layer = CachedTileLayer(self, record, array(gids['typecode'], data[start:start + gids['length']]))
+            elif record['kind'] == 'objects':
+                layer = CachedObjectGroup(self, record)
+            else:
+                layer = CachedLayer(record)
+            self.layers.append(layer)
+            self.layernames[layer.name] = layer
+
+    @property
+    def visible_layers(self):
+        return (layer for layer in self.layers if layer.visible)
+
+    @property
+    def objectgroups(self):
+        return (layer for layer in self.layers if isinstance(layer, CachedObjectGroup))
+
+    @property
+    def objects(self):
+        return chain(*self.objectgroups)
+
+    def get_layer_by_name(self, name):
+        try:
+            return self.layernames[name]
+        except KeyError:
+            raise ValueError(f'Layer "{name}" not found.')
+
+    def get_tile_image_by_gid(self, gid):
+        return self.images[gid]
+
+class CachedLayer:
+    def __init__(self, record):
+        self.name = record['name']
+        self.visible = record['visible']
+        self.opacity = record['opacity']
+        self.properties = record['properties']
+
+class CachedTileLayer(CachedLayer):
+    def __init__(self, parent, record, gids):
+        super().__init__(record)
+        self.parent = parent
+        self.width = record['width']
+        self.height = record['height']
+        self.data = [gids[y * self.width:(y + 1) * self.width] for y in range(self.height)]
+
+    def __iter__(self):
+        return self.iter_data()
+
+    def iter_data(self):
+        for y, row in enumerate(self.data):
+            for x, gid in enumerate(row):
+                yield x, y, gid
+
+    def tiles(self):
+        images = self.parent.images
+        for x, y, gid in self.iter_data():
+            if gid:
+                yield x, y, images[gid]
+
+class CachedObjectGroup(CachedLayer):
+    def __init__(self, parent, record):
+        super().__init__(record)
+        self.objects = [CachedObject(parent, obj) for obj in record['objects']]
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+class CachedObject:
+    def __init__(self, parent, record):
+        self.parent = parent
+        self.id = record['id']
+        self.name = record['name']
+        self.type = record['type']
+        self.x = record['x']
+        self.y = record['y']
+        self.width = record['width']
+        self.height = record['height']
+        self.rotation = record['rotation']
+        self.visible = record['visible']
+        self.properties = record['properties']
+        self.gid = record['image'] or 0
+
+    @property
+    def image(self):
+        return self.parent.images[self.gid] if self.gid else None
+
+if __name__ == '__main__':
+    # Compile ahead of time: python mapcache.py [map.tmx ...]
+    import sys
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    for path in sys.argv[1:] or [os.path.join(os.path.dirname(__file__), '../data/map.tmx')]:
+        load_map(path)
+        print(f'{path} -> {cache_path(os.path.abspath(path))}')
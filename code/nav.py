@@ -0,0 +1,227 @@
+import heapq
+from collections import deque, OrderedDict
+from settings import *
+
+class NavGrid:
+    def __init__(self, mask):
+        #walkability comes from the level's CollisionMask, tiles are indexed by y * width + x
+        self.mask = mask
+        self.width = mask.width
+        self.height = mask.height
+        self.neighbours = None #built on first query, once every obstacle is blocked
+        self.fields = {} #goal index -> BFS distance to every tile (-1 when unreachable)
+        self.paths = OrderedDict() #A* results by (start, goal), least recently used first
+
+    def walkable(self, index):
+        return not self.mask.blocked(index % self.width, index // self.width)
+
+    def tile_at(self, pos):
+        x = min(max(int(pos[0] // TILE_SIZE), 0), self.width - 1)
+        y = min(max(int(pos[1] // TILE_SIZE), 0), self.height - 1)
+        return x, y
+
+    def index(self, tile):
+        return tile[1] * self.width + tile[0]
+
+    def tile(self, index):
+        return index % self.width, index // self.width
+
+    def build_neighbours(self):
+        width, height, blocked = self.width, self.height, self.mask.blocked
+        self.neighbours = []
+        for index in range(width * height):
+            x, y = index % width, index // width
+            steps = []
+            if not blocked(x, y):
+                if not blocked(x, y - 1): steps.append(index - width)
+                if not blocked(x, y + 1): steps.append(index + width)
+                if not blocked(x - 1, y): steps.append(index - 1)
+                if not blocked(x + 1, y): steps.append(index + 1)
+            self.neighbours.append(steps)
+
+    def nearest_walkable(self, tile):
+        #the tile itself, or the closest walkable one when it sits in an obstacle
+        start = self.index(tile)
+        if self.walkable(start):
+            return tile
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            if self.walkable(index):
+                return self.tile(index)
+            x, y = self.tile(index)
+            for nx, ny in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)):
+                if 0 <= nx < self.width and 0 <= ny < self.height and ny * self.width + nx not in seen:
+                    seen.add(ny * self.width + nx)
+                    queue.append(ny * self.width + nx)
+        return tile
+
+    def distance_field(self, goal):
+        # Breadth-first distances to goal from every tile, computed once per goal and kept
+        # (the map never changes, so a door's field lasts across days)
+        goal = self.index(self.nearest_walkable(goal))
+        if goal not in self.fields:
+            if self.neighbours is None:
+                self.build_neighbours()
+            neighbours = self.neighbours
+            distances = [-1] * (self.width * self.height)
+            distances[goal] = 0
+            queue = deque([goal])
+            while queue:
+                index = queue.popleft()
+                step = distances[index] + 1
+                for neighbour in neighbours[index]:
+                    if distances[neighbour] < 0:
+                        distances[neighbour] = step
+                        queue.append(neighbour)
+            self.fields[goal] = distances
+        return self.fields[goal]
+
+    def distance(self, start, goal):
+        #tiles to walk from start to goal, None when unreachable; goal must have a distance field
+        distance = self.distance_field(goal)[self.index(self.nearest_walkable(start))]
+        return distance if distance >= 0 else None
+
+    def find_path(self, start, goal):
+        # Tiles from start to goal (both included), [] when unreachable. Goals with a distance field
+        # (the doors) are reached by walking down the field, anything else goes through cached A*
+        start = self.index(self.nearest_walkable(start))
+        goal = self.index(self.nearest_walkable(goal))
+        if goal in self.fields:
+            return self.descend(start, self.fields[goal])
+
+        key = (start, goal)
+        if key in self.paths:
+            self.paths.move_to_end(key)
+            return self.paths[key]
+        path = self.astar(start, goal)
+        self.paths[key] = path
+        if len(self.paths) > NAV_PATH_CACHE:
+            self.paths.popitem(last=False)
+        return path
+
+    def descend(self, start, distances):
+        if distances[start] < 0:
+            return []
+        neighbours = self.neighbours
+        path = [self.tile(start)]
+        index = start
+        while distances[index] > 0:
+            target = distances[index] - 1
+            index = next(neighbour for neighbour in neighbours[index] if distances[neighbour] == target)
+            path.append(self.tile(index))
+        return path
+
+    def astar(self, start, goal):
+        if self.neighbours is None:
+            self.build_neighbours()
+        neighbours, width = self.neighbours, self.width
+        goal_x, goal_y = goal % width, goal // width
+
+        came_from = {start: None}
+        cost = {start: 0}
+        frontier = [(0, start)]
+        while frontier:
+            _, index = heapq.heappop(frontier)
+            if index == goal:
+                path = []
+                while index is not None:
+                    path.append(self.tile(index))
+                    index = came_from[index]
+                return path[::-1]
+
+            step = cost[index] + 1
+            for neighbour in neighbours[index]:
+                if step < cost.get(neighbour, step + 1):
+                    cost[neighbour] = step
+                    came_from[neighbour] = index
+                    #manhattan distance never overestimates on a 4-connected grid
+                    estimate = abs(neighbour % width - goal_x) + abs(neighbour // width - goal_y)
+                    heapq.heappush(frontier, (step + estimate, neighbour))
+        return []
+
+class RoutePlanner:
+    def __init__(self, nav, doors):
+        #doors maps a door name to its tile; their distance fields make up the door-to-door matrix
+        self.nav = nav
+        self.doors = {name: nav.nearest_walkable(tile) for name, tile in doors.items()}
+        self.matrix = {}
+        for name, tile in self.doors.items():
+            field = nav.distance_field(tile)
+            self.matrix[name] = {other: field[nav.index(other_tile)] for other, other_tile in self.doors.items()}
+        self.cached_key = None
+        self.cached_route = ([], [])
+
+    def plan(self, start, names):
+        # Visiting order for the doors in names, starting at the start tile: nearest neighbour first,
+        # then 2-opt and or-opt moves until none shortens the walk. Unreachable doors are left out
+        nav, matrix = self.nav, self.matrix
+        start_distance = {name: nav.distance(start, self.doors[name]) for name in names}
+        remaining = [name for name in names if start_distance[name] is not None]
+
+        tour = []
+        while remaining:
+            if tour:
+                row = matrix[tour[-1]]
+                closest = min(remaining, key=lambda name: row[name])
+            else:
+                closest = min(remaining, key=start_distance.__getitem__)
+            tour.append(closest)
+            remaining.remove(closest)
+
+        def leg(a, b):
+            #a is None for the start tile, b is None past the last door (the tour doesn't walk back)
+            if b is None:
+                return 0
+            return start_distance[b] if a is None else matrix[a][b]
+
+        while self.two_opt(tour, leg) or self.or_opt(tour, leg):
+            pass
+        return tour
+
+    def two_opt(self, tour, leg):
+        #reversing tour[i:j + 1] swaps the edges (i - 1, i) and (j, j + 1) for (i - 1, j) and (i, j + 1)
+        for i in range(len(tour) - 1):
+            before = tour[i - 1] if i else None
+            for j in range(i + 1, len(tour)):
+                after = tour[j + 1] if j + 1 < len(tour) else None
+                if leg(before, tour[j]) + leg(tour[i], after) < leg(before, tour[i]) + leg(tour[j], after):
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    return True
+        return False
+
+    def or_opt(self, tour, leg):
+        #moves a run of up to three doors to another place in the tour, in either direction
+        for length in (1, 2, 3):
+            for i in range(len(tour) - length + 1):
+                run = tour[i:i + length]
+                rest = tour[:i] + tour[i + length:]
+                before = tour[i - 1] if i else None
+                after = tour[i + length] if i + length < len(tour) else None
+                saved = leg(before, run[0]) + leg(run[-1], after) - leg(before, after)
+                for p in range(len(rest) + 1):
+                    if p == i:
+                        continue #its own place
+                    c = rest[p - 1] if p else None
+                    d = rest[p] if p < len(rest) else None
+                    for moved in (run, run[::-1]):
+                        if leg(c, moved[0]) + leg(moved[-1], d) - leg(c, d) < saved:
+                            tour[:] = rest[:p] + moved + rest[p:]
+                            return True
+        return False
+
+    def route(self, start, names):
+        #(tour, tiles along the whole walk), re-planned only when the start tile or the doors change
+        key = (start, tuple(names))
+        if key != self.cached_key:
+            tour = self.plan(start, names)
+            tiles = []
+            position = start
+            for name in tour:
+                path = self.nav.find_path(position, self.doors[name])
+                tiles.extend(path[1:] if tiles else path)
+                position = self.doors[name]
+            self.cached_key = key
+            self.cached_route = (tour, tiles)
+        return self.cached_route
@@ -1,10 +1,10 @@
-import pygame
+import pygame, os
 from settings import *
 from support import *
-from random import randint
+import random
 
 class Player(pygame.sprite.Sprite):
-    def __init__(self, pos, group, collision_sprites, interaction, screen, toggle_map, toggle_dialogue_box):
+    def __init__(self, pos, group, collision_sprites, screen, rng=random):
         super().__init__(group)
 
         self.import_assets()
@@ -19,7 +19,9 @@ class Player(pygame.sprite.Sprite):
         #movement attributes
         self.direction = pygame.math.Vector2()
         self.pos = pygame.math.Vector2(self.rect.center)
+        self.previous_center = self.rect.center #where the last level step started, for interpolated drawing
         self.speed = 200
+        self.animating = True #headless levels turn it off, nothing shows the frames
 
         #collision
         self.hitbox = self.rect.copy().inflate((-126, -70))
@@ -27,18 +29,22 @@ class Player(pygame.sprite.Sprite):
 
         #inventory
         self.inventory = {
-            'packages': randint(7, 12)
+            'packages': rng.randint(7, 12)
         }
 
-        #interaction
-        self.interaction = interaction
-        self.can_interact = True #flag to manage interaction cooldown
-        self.toggle_dialogue_box = toggle_dialogue_box
-        self.toggle_map = toggle_map
-
         #level boundaries
         self.level_bounds = LEVEL_BOUNDS
 
+    def respawn(self, pos):
+        self.rect.center = pos
+        self.hitbox.center = self.rect.center
+        self.pos.update(self.rect.center)
+        self.previous_center = self.rect.center #teleported, nothing to interpolate from
+        self.direction.update(0, 0)
+        self.status = 'down_idle'
+        self.frame_index = 0
+        self.image = self.animations[self.status][self.frame_index]
+
     def import_assets(self):
         self.animations = {
             'up': [], 'down': [], 'left': [], 'right': [],
@@ -57,8 +63,7 @@ class Player(pygame.sprite.Sprite):
 
         self.image = self.animations[self.status][int(self.frame_index)]
 
-    def input(self):
-        keys = pygame.key.get_pressed()
+    def input(self, keys):
 
         #WASD controls
         if keys[pygame.K_w]:
@@ -79,24 +84,6 @@ class Player(pygame.sprite.Sprite):
         else:
             self.direction.x = 0
 
-        #door interaction
-        if keys[pygame.K_f] and self.can_interact:
-            self.can_interact = False #prevent repeated interaction
-            collided_interaction_sprite = pygame.sprite.spritecollide(self, self.interaction, False)
-            if collided_interaction_sprite:
-                door = collided_interaction_sprite[0]
-                # print(f"Interacting with {door.name}")  #DEBUG
-                result = self.deliver_package(door)
-                # print(result) #DEBUG
-                self.toggle_dialogue_box()
-        
-        if not keys[pygame.K_f]:
-            self.can_interact = True
-        
-        #open map
-        if keys[pygame.K_m]:
-            self.toggle_map()
-
     def get_status(self):
         #checks if player is not moving
         if self.direction.magnitude() == 0:
@@ -104,24 +91,24 @@ class Player(pygame.sprite.Sprite):
             self.status = self.status.split('_')[0] + '_idle'
 
     def collision(self, direction):
-        for sprite in self.collision_sprites.sprites():
-            if hasattr(sprite, 'hitbox'):
-                if sprite.hitbox.colliderect(self.hitbox):
-                    if direction == 'horizontal':
-                        if self.direction.x > 0: # moving right
-                            self.hitbox.right = sprite.hitbox.left
-                        elif self.direction.x < 0: # moving left
-                            self.hitbox.left = sprite.hitbox.right
-                        self.rect.centerx = self.hitbox.centerx
-                        self.pos.x = self.hitbox.centerx
-                        
-                    elif direction == 'vertical':
-                        if self.direction.y > 0: # moving down
-                            self.hitbox.bottom = sprite.hitbox.top
-                        elif self.direction.y < 0: # moving up
-                            self.hitbox.top = sprite.hitbox.bottom
-                        self.rect.centery = self.hitbox.centery
-                        self.pos.y = self.hitbox.centery
+        #broadphase: only hitboxes near the player, with a tile of margin for the push-out
+        for sprite in self.collision_sprites.near(self.hitbox.inflate(TILE_SIZE, TILE_SIZE)):
+            if sprite.hitbox.colliderect(self.hitbox):
+                if direction == 'horizontal':
+                    if self.direction.x > 0: # moving right
+                        self.hitbox.right = sprite.hitbox.left
+                    elif self.direction.x < 0: # moving left
+                        self.hitbox.left = sprite.hitbox.right
+                    self.rect.centerx = self.hitbox.centerx
+                    self.pos.x = self.hitbox.centerx
+                    
+                elif direction == 'vertical':
+                    if self.direction.y > 0: # moving down
+                        self.hitbox.bottom = sprite.hitbox.top
+                    elif self.direction.y < 0: # moving up
+                        self.hitbox.top = sprite.hitbox.bottom
+                    self.rect.centery = self.hitbox.centery
+                    self.pos.y = self.hitbox.centery
 
     def move(self, dt):
         #normalize the direction vector (ensures consistent speed, even when moving diagonally)
@@ -156,21 +143,9 @@ class Player(pygame.sprite.Sprite):
             self.rect.bottom = self.level_bounds['bottom']
             self.pos.y = self.rect.centery
 
-    def deliver_package(self, door):
-        # print(f"Checking door: {door.name}, Package Assigned: {door.package_assigned}, Delivered: {door.delivered}")  # DEBUG
-        # Check for package delivery to the door
-        if door.package_assigned and not door.delivered:
-            door.delivered = True
-            door.package_assigned = False  # Mark as delivered
-            # print(f"Package delivered to {door.name}!")  # DEBUG
-            return "Package delivered!"
-        elif door.delivered:
-            return "Package delivered!"
-        else:
-            return "Wrong house!"
-
-    def update(self, dt):
-        self.input()
+    def update(self, dt, keys):
+        self.input(keys)
         self.get_status()
         self.move(dt)
-        self.animate(dt)
\ No newline at end of file
+        if self.animating:
+            self.animate(dt)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os, time, pygame
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+from assets import assets
+from atlas import decode, folder_images
+from mapcache import read_map, CachedMap
+from hud import TextWidget
+from problems import problems, report
+
+class Preloader:
+    def __init__(self, workers=PRELOAD_WORKERS):
+        # Loads what the level needs into the asset registry ahead of it. Files are read and PNGs decoded on
+        # a thread pool (pygame lets go of the GIL while SDL_image decodes); convert_alpha needs the display,
+        # so poll() finishes every job on the main thread
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.jobs = [] #(futures, finish, name), finish gets the futures' results once they are all done
+        self.total = 0
+
+        if assets.atlas:
+            atlas = assets.atlas
+            folders, sources, manifest = atlas.check()
+            if manifest is not None:
+                self.add([atlas.read], lambda data: self.finish_atlas(manifest, data[0]), 'the sprite atlas')
+            else:
+                paths = [path for folder in folders for path in folder_images(folder)]
+                self.add([lambda path=path: decode(path) for path in paths],
+                         lambda decoded: atlas.build(folders, sources, decoded), 'the sprite atlas')
+
+        for image in PRELOAD_IMAGES:
+            path = os.path.abspath(os.path.join(GRAPHICS_DIR, image))
+            self.add([lambda path=path: decode(path)], lambda decoded, path=path: self.finish_image(path, decoded[0]), path)
+
+        # The map cache is read (or compiled) on a worker, only its tileset atlas is converted on the main thread
+        map_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/map.tmx"))
+        if MAP_CACHE:
+            self.add([lambda: read_map(map_path)],
+                     lambda result: assets.put(('tmx', map_path), CachedMap(*result[0])), map_path)
+        else:
+            self.add([], lambda _: assets.tmx(map_path), map_path)
+
+    def add(self, tasks, finish, name):
+        self.jobs.append(([self.pool.submit(task) for task in tasks], finish, name))
+        self.total += 1
+
+    def add_stage(self, stage):
+        # Main thread work after everything added so far, e.g. a stage of building the level. Unlike
+        # assets, which are loaded again on demand when preloading fails, its errors are raised
+        self.jobs.append(([], lambda _: stage(), None))
+        self.total += 1
+
+    def finish_atlas(self, manifest, data):
+        try:
+            assets.atlas.restore(manifest, data)
+        except ValueError:
+            assets.atlas.load() #pixels don't match the manifest: rebuilt
+
+    def finish_image(self, path, surf):
+        if surf is None:
+            raise pygame.error('not a readable image')
+        assets.put(('image', path, True), surf.convert_alpha())
+
+    def poll(self, budget=PRELOAD_BUDGET):
+        # Finishes decoded jobs, in order, until budget ms have gone by. Returns the progress (0 to 1)
+        start = time.perf_counter()
+        while self.jobs and all(future.done() for future in self.jobs[0][0]):
+            futures, finish, name = self.jobs.pop(0)
+            if name is None:
+                finish([])
+            else:
+                try:
+                    finish([future.result() for future in futures])
+                except Exception as error:
+                    report(f'Warning: preloading {name} failed, left to load on demand: {error}')
+            if (time.perf_counter() - start) * 1000 >= budget:
+                break
+        if not self.jobs:
+            self.pool.shutdown()
+        return self.progress
+
+    @property
+    def progress(self):
+        return 1 - len(self.jobs) / self.total if self.total else 1
+
+    @property
+    def done(self):
+        return not self.jobs
+
+class LoadingScreen:
+    def __init__(self, surface):
+        self.display_surface = surface
+        font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
+        self.message = TextWidget(assets.font(font_path, 20), "Loading...", WHITE, center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 30))
+        self.bar = pygame.Rect(0, 0, SCREEN_WIDTH // 3, 16)
+        self.bar.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 10)
+        self.problem_font = assets.font(font_path, 8)
+        self.problem_lines = [] #the latest reported problems, under the bar
+
+    def draw(self, progress):
+        self.display_surface.fill('black')
+        self.message.draw(self.display_surface)
+        pygame.draw.rect(self.display_surface, GREY, self.bar)
+        pygame.draw.rect(self.display_surface, WHITE, (self.bar.x, self.bar.y, self.bar.width * progress, self.bar.height))
+
+        latest = problems[-LOADING_PROBLEM_LINES:]
+        if [line.value for line in self.problem_lines] != latest:
+            self.problem_lines = [TextWidget(self.problem_font, problem, WHITE, midtop=(SCREEN_WIDTH // 2, self.bar.bottom + 30 + 14 * i))
+                                  for i, problem in enumerate(latest)]
+        for line in self.problem_lines:
+            line.draw(self.display_surface)
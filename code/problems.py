@@ -0,0 +1,11 @@
+import sys
+
+# Problems the game carries on after (an image that didn't load, a cache that couldn't be written).
+# Modules report them here instead of printing; the loading screen shows the latest ones
+
+problems = []
+
+def report(message):
+    #safe from any thread
+    problems.append(message)
+    sys.stderr.write(message + '\n')
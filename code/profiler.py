@@ -0,0 +1,137 @@
+import os, time, json
+import pygame
+from collections import deque
+from settings import *
+
+class Profiler:
+    def __init__(self, stages=PROFILER_STAGES, counters=PROFILER_COUNTERS, window=PROFILER_WINDOW):
+        self.stage_names = stages
+        self.counter_names = counters
+        self.visible = False
+        self.active = False #measuring, when the overlay is shown or timings are exported
+
+        #current frame
+        self.frame_start = 0
+        self.stages = dict.fromkeys(stages, 0.0)
+        self.counters = dict.fromkeys(counters, 0)
+        self.open_stages = []
+
+        #rolling history for the overlay
+        self.frame_count = 0
+        self.history = {name: deque(maxlen=window) for name in ('frame',) + stages + counters}
+
+        self.export_file = None
+        self.export_format = None
+        self.overlay = None
+        self.atlas = None
+        self.drawn_rect = None #where the overlay went last frame
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.active = self.visible or self.export_file is not None
+
+    def start_export(self, path):
+        #per frame timings streamed as csv or jsonl, picked from the file extension
+        self.export_format = 'csv' if path.endswith('.csv') else 'jsonl'
+        self.export_file = open(path, 'w')
+        if self.export_format == 'csv':
+            self.export_file.write(','.join(('frame', 'frame_ms') + self.stage_names + self.counter_names) + '\n')
+        self.active = True
+
+    def stop_export(self):
+        if self.export_file:
+            self.export_file.close()
+            self.export_file = None
+        self.active = self.visible
+
+    #stage timing, used as `with profiler.stage('draw'):`
+    def stage(self, name):
+        self.open_stages.append((name, time.perf_counter()) if self.active else None)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        opened = self.open_stages.pop()
+        if opened:
+            name, start = opened
+            self.stages[name] += time.perf_counter() - start
+        return False
+
+    def count(self, name, amount=1):
+        if self.active:
+            self.counters[name] += amount
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if not self.active:
+            return
+
+        frame_ms = (time.perf_counter() - self.frame_start) * 1000
+        stage_ms = {name: seconds * 1000 for name, seconds in self.stages.items()}
+        self.frame_count += 1
+
+        self.history['frame'].append(frame_ms)
+        for name, value in list(stage_ms.items()) + list(self.counters.items()):
+            self.history[name].append(value)
+
+        if self.export_file:
+            self.export(frame_ms, stage_ms)
+        if self.visible and self.frame_count % PROFILER_REFRESH == 0:
+            self.overlay = None #re-render the overlay with the new averages
+
+        self.stages = dict.fromkeys(self.stage_names, 0.0)
+        self.counters = dict.fromkeys(self.counter_names, 0)
+
+    def export(self, frame_ms, stage_ms):
+        if self.export_format == 'csv':
+            values = [self.frame_count, f'{frame_ms:.3f}'] + [f'{stage_ms[name]:.3f}' for name in self.stage_names] + \
+                     [self.counters[name] for name in self.counter_names]
+            self.export_file.write(','.join(map(str, values)) + '\n')
+        else:
+            record = {'frame': self.frame_count, 'frame_ms': round(frame_ms, 3)}
+            record.update({name: round(value, 3) for name, value in stage_ms.items()})
+            record.update(self.counters)
+            self.export_file.write(json.dumps(record) + '\n')
+
+        if self.frame_count % FPS == 0:
+            self.export_file.flush()
+
+    def averages(self):
+        return {name: sum(values) / len(values) for name, values in self.history.items() if values}
+
+    def draw(self, surface):
+        if not self.visible:
+            self.drawn_rect = None
+            return
+
+        if self.overlay is None:
+            self.overlay = self.render_overlay()
+        self.drawn_rect = surface.blit(self.overlay, (SCREEN_WIDTH - self.overlay.get_width() - 10, 10))
+
+    def render_overlay(self):
+        #imported here, text.py itself reports to the profiler
+        from assets import assets
+        from text import GlyphAtlas
+
+        if self.atlas is None:
+            font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
+            self.atlas = GlyphAtlas(assets.font(font_path, 8), WHITE)
+
+        averages = self.averages()
+        lines = [f"frame {averages.get('frame', 0):6.2f} ms"]
+        lines += [f'{name:<12} {averages.get(name, 0):6.2f} ms' for name in self.stage_names]
+        lines += [f'{name:<12} {averages.get(name, 0):6.0f}' for name in self.counter_names]
+
+        line_height = self.atlas.height + 4
+        overlay = pygame.Surface((max(self.atlas.width(line) for line in lines) + 16, len(lines) * line_height + 12), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for index, line in enumerate(lines):
+            self.atlas.draw(overlay, self.atlas.place_line(line), (8, 6 + index * line_height), special_flags=0)
+        return overlay
+
+#shared by every module, measuring costs nothing while inactive
+profiler = Profiler()
@@ -1,10 +1,13 @@
-import pygame
+import pygame, os
 
 #screen
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 TILE_SIZE = 64
 FPS = 60
+FIXED_TIMESTEP = False #simulate in fixed steps and interpolate the drawing, instead of one variable step per frame
+FIXED_STEP = 1 / FPS #seconds per simulation step in the fixed timestep loop
+MAX_CATCH_UP_STEPS = 5 #most steps simulated for one drawn frame, time past that is dropped
 
 LAYERS = {
     'water': 0,
@@ -18,6 +21,73 @@ LAYERS = {
 
 LEVEL_BOUNDS = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
 
+#rendering
+GRID_CELL_SIZE = TILE_SIZE * 4 #spatial index cell, in pixels (tile aligned)
+STATIC_CHUNKS = True #bake static tile layers into chunk surfaces instead of one sprite per tile
+CHUNK_TILES = 16 #chunk width in tiles
+WATER_CHUNK_TILES = 8 #animated water chunks are square, one baked surface per frame
+DIRTY_RECTS = False #redraw and present only the parts of the screen that changed (full frames on camera or tint changes, rain and overlays)
+DIRTY_RECT_LIMIT = 16 #more separate changed areas than this (e.g. a crowd of couriers on screen) and the frame is redrawn in full
+
+#world streaming
+WORLD_STREAMING = False #build only the chunks near the player instead of the whole map at startup
+WORLD_CHUNK_TILES = 16 #chunk side in tiles, a multiple of CHUNK_TILES and WATER_CHUNK_TILES
+WORLD_LOAD_RADIUS = 1 #chunks around the player's chunk that are kept built
+WORLD_EVICT_RADIUS = 2 #chunks further away than this are dropped
+WORLD_PREFETCH = True #bake the next chunks in the walking direction on a background thread
+
+#sky
+SKY_RAMP_RESOLUTION = 10 #precomputed sky colors per second of in-game time
+
+#rain
+RAIN_INTENSITY = 1 #drops per frame at FPS over the whole ground
+RAIN_CAPACITY = 512 #max live particles per rain layer
+RAIN_MARGIN = TILE_SIZE * 8 #spawn area around the camera, in pixels
+
+#dialogue
+DIALOGUE_REVEAL_SPEED = 0 #typewriter reveal in characters per second (e.g. 60), 0 shows text at once
+
+#navigation
+NAV_PATH_CACHE = 64 #A* paths kept for goals without a precomputed distance field
+
+#couriers
+COURIER_COUNT = 24 #NPC couriers walking between the doors
+COURIER_SPEED = 150 #average walking speed in pixels per second (the player walks at 200)
+COURIER_WAIT = 1.5 #seconds spent at a door
+COURIER_TINTS = ((255, 214, 170), (180, 205, 255), (200, 255, 190), (255, 190, 225)) #uniform colours, one per courier
+
+#headless simulation
+HEADLESS_COURIER_STEP = 0.5 #seconds of game time between courier updates in headless levels, 0 leaves the couriers out
+HEADLESS_STEP = 0.5 #seconds per step when running whole days headless, coarse enough to be fast while walking and couriers behave as in play
+HEADLESS_DAYS_TARGET = 60 #in-game days per second a headless run at HEADLESS_STEP has to reach (checked by benchmarks/bench.py)
+
+#input
+INPUT_KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d, pygame.K_f, pygame.K_m, pygame.K_ESCAPE) #keys the game reads, in recording bit order
+
+#profiler
+PROFILER_STAGES = ('draw', 'update', 'interactions', 'couriers', 'rain', 'sky', 'transition', 'world', 'hud', 'dialogue')
+PROFILER_COUNTERS = ('blits', 'font.render', 'steps')
+PROFILER_WINDOW = 120 #frames in the rolling averages
+PROFILER_REFRESH = 15 #frames between overlay redraws
+PROFILER_KEY = pygame.K_F3
+
+#assets
+ASSET_CACHE_SIZE = 256 #max cached assets before least recently used ones are evicted
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache') #compiled assets, safe to delete
+MAP_CACHE = True #load maps from a compiled binary cache, rebuilt when the .tmx, its tilesets or their images change
+ATLAS_WIDTH = 1024 #width of packed texture atlases, in pixels
+GRAPHICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'graphics')
+SPRITE_ATLAS = True #serve animation frames from one packed atlas instead of a surface per file
+ATLAS_FOLDERS = ('character', 'water', 'rain') #frame folders (under GRAPHICS_DIR) that go into the atlas
+PRELOAD_WORKERS = 0 #threads decoding images behind the loading screen, 0 for one per core
+PRELOAD_IMAGES = ('world/ground.png', 'ui/box.png') #single images (under GRAPHICS_DIR) the level loads
+PRELOAD_BUDGET = 8 #ms per loading screen frame spent finishing decoded images on the main thread
+LOADING_PROBLEM_LINES = 4 #latest reported problems (see problems.py) listed under the loading bar
+
 #colors
 GREY = (70, 70, 70)
-WHITE = [255, 255, 255]
\ No newline at end of file
+WHITE = [255, 255, 255]
+RED = (214, 69, 65)
+YELLOW = (240, 196, 25)
+GREEN = (88, 166, 72)
+BLUE = (65, 131, 215)
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+
+#no window: SDL renders to memory, so the game logic can run anywhere
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from settings import *
+from level import Level
+from inputs import InputState
+
+class Simulation:
+    def __init__(self, seed=0, dirty_rects=DIRTY_RECTS, headless=False):
+        #headless when nothing will draw the level (see Level), e.g. long runs for balancing
+        pygame.init()
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.level = Level(screen, seed, dirty_rects, headless)
+        self.time = 0
+
+    def step(self, dt, inputs=None):
+        self.level.step(dt, inputs or InputState())
+        self.time += dt
+
+    def run_days(self, days, dt=1 / FPS, inputs=None):
+        #fixed steps until the requested number of day rollovers happened
+        end_day = self.level.day + days
+        while self.level.day < end_day:
+            self.step(dt, inputs)
+        return self.level.day
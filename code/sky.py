@@ -1,65 +1,102 @@
 import pygame, os
 from settings import *
 from support import import_folder
-from sprites import Generic
-from random import randint, choice
+from assets import assets
+import numpy as np
+from profiler import profiler
 
 class Sky:
     def __init__(self):
-        self.display_surface = pygame.display.get_surface()
-        self.full_surf = pygame.Surface((SCREEN_WIDTH,SCREEN_HEIGHT))
-        self.start_color = list(WHITE)
+        self.start_color = tuple(WHITE)
         self.end_color = (38, 101, 189)
         self.speed = 1.5
-        self.reached_end_color = False
+
+        #day to night color ramp, one entry per 1 / SKY_RAMP_RESOLUTION seconds of the day
+        self.duration = max(abs(start - end) for start, end in zip(self.start_color, self.end_color)) / self.speed
+        steps = int(self.duration * SKY_RAMP_RESOLUTION) + 1
+        self.ramp = [self.color_at(step / SKY_RAMP_RESOLUTION) for step in range(steps + 1)]
+
+        self.reset()
+
+    def color_at(self, time):
+        color = []
+        for start, end in zip(self.start_color, self.end_color):
+            if start > end:
+                color.append(int(max(start - self.speed * time, end)))  # Prevent going past target
+            else:
+                color.append(int(min(start + self.speed * time, end)))  # Prevent overshooting
+        return tuple(color)
 
     def display(self, dt):
-        self.reached_end_color = True
-        for index, value in enumerate(self.end_color):
-            if self.start_color[index] > value:
-                self.start_color[index] = max(self.start_color[index] - self.speed * dt, value)  # Prevent going past target
-                self.reached_end_color = False
-            elif self.start_color[index] < value:
-                self.start_color[index] = min(self.start_color[index] + self.speed * dt, value)  # Prevent overshooting
-                self.reached_end_color = False
-            
-        # print(f'Sky color: {self.start_color}') #DEBUG
-
-        #fill screen with overlay / color
-        self.full_surf.fill(self.start_color)
-        self.display_surface.blit(self.full_surf, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
-    
+        #advance the time of day, the tint itself is applied by the compositor
+        self.time += dt
+        self.color = self.ramp[min(int(self.time * SKY_RAMP_RESOLUTION), len(self.ramp) - 1)]
+        self.reached_end_color = self.time >= self.duration
+
+        # print(f'Sky color: {self.color}') #DEBUG
+
     def reset(self):
-        self.start_color = list(WHITE)
+        self.time = 0
+        self.color = self.ramp[0]
         self.reached_end_color = False
 
-class Drop(Generic):
-    def __init__(self, pos, surf, moving, groups, z):
-        #general setup
-        super().__init__(pos, surf, groups, z)
-        self.life_time = randint(400, 500)
-        self.start_time = pygame.time.get_ticks()
+class Particles:
+    def __init__(self, capacity):
+        #preallocated buffers, live particles are packed at the front
+        self.capacity = capacity
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), np.float32)
+        self.vel = np.zeros((capacity, 2), np.float32)
+        self.age = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.float32)
+        self.variant = np.zeros(capacity, np.int16)
+
+    def spawn(self, amount, area, variants, speed, direction, rng):
+        amount = min(amount, self.capacity - self.count)
+        if amount <= 0:
+            return
 
-        #moving parts
-        self.moving = moving
-        if self.moving:
-            self.pos = pygame.math.Vector2(self.rect.topleft)
-            self.direction = pygame.math.Vector2(-2, 4)
-            self.speed = randint(200, 250)
+        new = slice(self.count, self.count + amount)
+        self.pos[new, 0] = rng.integers(area.left, area.right, amount, endpoint=True)
+        self.pos[new, 1] = rng.integers(area.top, area.bottom, amount, endpoint=True)
+        self.vel[new] = np.outer(rng.integers(speed[0], speed[1], amount, endpoint=True), direction)
+        self.age[new] = 0
+        self.life[new] = rng.integers(400, 500, amount, endpoint=True) / 1000
+        self.variant[new] = rng.integers(0, variants, amount)
+        self.count += amount
 
     def update(self, dt):
-        #movement
-        if self.moving:
-            self.pos += self.direction * self.speed * dt
-            self.rect.topleft = (round(self.pos.x), round(self.pos.y))
+        live = slice(0, self.count)
+        self.pos[live] += self.vel[live] * dt
+        self.age[live] += dt
+
+        #compact the survivors to the front of the buffers
+        alive = np.flatnonzero(self.age[live] < self.life[live])
+        if len(alive) < self.count:
+            keep = slice(0, len(alive))
+            for buffer in (self.pos, self.vel, self.age, self.life, self.variant):
+                buffer[keep] = buffer[alive]
+            self.count = len(alive)
+
+    def clear(self):
+        self.count = 0
 
-        #timer
-        if pygame.time.get_ticks() - self.start_time >= self.life_time:
-            self.kill()
+    def draw(self, surface, images, offset):
+        if not self.count:
+            return
+
+        screen_pos = np.rint(self.pos[:self.count]).astype(np.int32) - offset
+        visible = np.flatnonzero(
+            (screen_pos[:, 0] > -TILE_SIZE) & (screen_pos[:, 0] < SCREEN_WIDTH) &
+            (screen_pos[:, 1] > -TILE_SIZE) & (screen_pos[:, 1] < SCREEN_HEIGHT))
+        surface.blits([(images[variant], tuple(pos)) for variant, pos in
+                       zip(self.variant[visible].tolist(), screen_pos[visible].tolist())], False)
+        profiler.count('blits', len(visible))
 
 class Rain:
-    def __init__(self, all_sprites):
+    def __init__(self, all_sprites, seed=None):
         self.all_sprites = all_sprites
+        self.rng = np.random.default_rng(seed)
 
         #rain drops
         rain_drop_path = os.path.join(os.path.dirname(__file__), "../graphics/rain/drops/")
@@ -71,27 +108,51 @@ class Rain:
 
         #floor level
         ground_path = os.path.join(os.path.dirname(__file__), "../graphics/world/ground.png")
-        ground_surface = pygame.image.load(ground_path)
+        ground_surface = assets.image(ground_path)
         self.floor_w, self.floor_h = ground_surface.get_size()
+        self.floor_rect = ground_surface.get_rect()
+
+        #same density as one drop and one puddle per frame over the whole ground at FPS
+        self.spawn_rate = FPS * RAIN_INTENSITY / (self.floor_w * self.floor_h)
+        self.spawn_debt = 0
+
+        #particles, drawn in one batch on their own layers
+        self.floor = Particles(RAIN_CAPACITY)
+        self.drops = Particles(RAIN_CAPACITY)
+        self.all_sprites.add_painter(LAYERS['rain floor'], self.draw_floor)
+        self.all_sprites.add_painter(LAYERS['rain drops'], self.draw_drops)
+
+    def spawn_area(self, focus):
+        # The view a camera centred on focus would show (kept on the ground like the camera is), extended
+        # up and right since drops fall down and to the left
+        view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        view.center = focus
+        view.clamp_ip(self.floor_rect)
+        view.inflate_ip(RAIN_MARGIN, RAIN_MARGIN)
+        view.move_ip(RAIN_MARGIN // 2, -RAIN_MARGIN // 2)
+        return view.clip(self.floor_rect)
+
+    def update(self, dt, focus):
+        #focus is what the camera follows (the player), passed in so stepping without drawing rains in the right place
+        self.floor.update(dt)
+        self.drops.update(dt)
+
+        area = self.spawn_area(focus)
+        self.spawn_debt += self.spawn_rate * area.width * area.height * dt
+        amount = int(self.spawn_debt)
+        self.spawn_debt -= amount
+
+        if amount:
+            self.floor.spawn(amount, area, len(self.rain_floor), (0, 0), (0, 0), self.rng)
+            self.drops.spawn(amount, area, len(self.rain_drops), (200, 250), (-2, 4), self.rng)
+
+    def clear(self):
+        self.floor.clear()
+        self.drops.clear()
+        self.spawn_debt = 0
+
+    def draw_floor(self, surface, offset):
+        self.floor.draw(surface, self.rain_floor, offset)
 
-    def create_floor(self):
-        Drop(
-            pos = (randint(0, self.floor_w), randint(0, self.floor_h)), 
-            surf = choice(self.rain_floor), 
-            moving = False, 
-            groups = self.all_sprites, 
-            z = LAYERS['rain floor']
-        )
-
-    def create_drops(self):
-        Drop(
-            pos = (randint(0, self.floor_w), randint(0, self.floor_h)), 
-            surf = choice(self.rain_drops), 
-            moving = True, 
-            groups = self.all_sprites, 
-            z = LAYERS['rain drops']
-        )
-    
-    def update(self):
-        self.create_floor()
-        self.create_drops()
\ No newline at end of file
+    def draw_drops(self, surface, offset):
+        self.drops.draw(surface, self.rain_drops, offset)
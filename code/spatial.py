@@ -0,0 +1,118 @@
+import pygame
+from settings import *
+
+class SpatialGrid:
+    def __init__(self, cell_size=GRID_CELL_SIZE, attr='rect'):
+        self.cell_size = cell_size
+        self.attr = attr #which rect of the sprite is indexed (e.g. 'rect' or 'hitbox')
+        self.cells = {}
+        self.sprite_cells = {}
+
+    def __len__(self):
+        return len(self.sprite_cells)
+
+    def __contains__(self, sprite):
+        return sprite in self.sprite_cells
+
+    def cells_for(self, rect):
+        size = self.cell_size
+        cols = range(rect.left // size, (rect.right - 1) // size + 1)
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        return [(col, row) for row in rows for col in cols]
+
+    def insert(self, sprite):
+        cells = self.cells_for(getattr(sprite, self.attr))
+        for cell in cells:
+            self.cells.setdefault(cell, {})[sprite] = None
+        self.sprite_cells[sprite] = cells
+
+    def remove(self, sprite):
+        for cell in self.sprite_cells.pop(sprite):
+            bucket = self.cells[cell]
+            del bucket[sprite]
+            if not bucket:
+                del self.cells[cell]
+
+    def move(self, sprite):
+        #only re-bin when the sprite crossed into different cells
+        if self.cells_for(getattr(sprite, self.attr)) != self.sprite_cells[sprite]:
+            self.remove(sprite)
+            self.insert(sprite)
+
+    def query(self, rect):
+        found = {}
+        cells = self.cells
+        for cell in self.cells_for(rect):
+            bucket = cells.get(cell)
+            if bucket:
+                found.update(bucket)
+
+        attr = self.attr
+        return [sprite for sprite in found if getattr(sprite, attr).colliderect(rect)]
+
+class CollisionGroup(pygame.sprite.Group):
+    def __init__(self, cell_size=TILE_SIZE):
+        super().__init__()
+        # Broadphase: hitboxes bucketed by cell, indexed lazily since sprites join before their hitbox exists
+        self.grid = SpatialGrid(cell_size, attr='hitbox')
+        self.pending = {}
+        self.order = {}
+        self.insert_count = 0
+
+        # The last query and its answer: a player standing still asks for the same area every step
+        self.last_rect = None
+        self.last_near = []
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.pending[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.last_rect = None
+        if sprite in self.pending:
+            del self.pending[sprite]
+        elif sprite in self.grid:
+            self.grid.remove(sprite)
+            del self.order[sprite]
+
+    def near(self, rect):
+        if self.pending:
+            for sprite in self.pending:
+                if hasattr(sprite, 'hitbox'):
+                    self.grid.insert(sprite)
+                    self.order[sprite] = self.insert_count
+                    self.insert_count += 1
+            self.pending.clear()
+            self.last_rect = None
+        elif rect == self.last_rect:
+            return self.last_near
+
+        #same order as iterating the whole group, so collision resolution doesn't change
+        self.last_near = sorted(self.grid.query(rect), key=self.order.__getitem__)
+        self.last_rect = pygame.Rect(rect)
+        return self.last_near
+
+class CollisionMask:
+    def __init__(self, width, height):
+        # Blocked tiles as bits: one int per row, bit x set when tile (x, y) is blocked. Not the Collision
+        # tile layer itself, the level blocks every tile any collision hitbox touches (see Level.create_collision_mask)
+        self.width = width
+        self.height = height
+        self.rows = [0] * height
+
+    def block(self, rect):
+        #every tile the rect overlaps, clipped to the map
+        left, top = max(rect.left // TILE_SIZE, 0), max(rect.top // TILE_SIZE, 0)
+        right = min((rect.right - 1) // TILE_SIZE, self.width - 1)
+        bottom = min((rect.bottom - 1) // TILE_SIZE, self.height - 1)
+        if left > right:
+            return
+        bits = (1 << (right + 1)) - (1 << left)
+        for y in range(top, bottom + 1):
+            self.rows[y] |= bits
+
+    def blocked(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+        return bool(self.rows[y] >> x & 1)
@@ -2,12 +2,19 @@ import pygame
 from settings import *
 
 class Generic(pygame.sprite.Sprite):
+    static = True #never moves once placed, so the camera never re-sorts it
+
     def __init__(self, pos, surf, groups, z = LAYERS['main']):
         super().__init__(groups)
         self.image = surf
         self.rect = self.image.get_rect(topleft = pos)
         self.z = z
-        self.hitbox = self.rect.copy().inflate(-self.rect.width * 0.2, -self.rect.height * 0.75)
+        self.hitbox = self.hitbox_for(self.rect)
+
+    @staticmethod
+    def hitbox_for(rect):
+        #also used for tiles whose sprite isn't loaded (see ChunkedWorld.hitboxes)
+        return rect.copy().inflate(-rect.width * 0.2, -rect.height * 0.75)
 
 class Interaction(Generic):
     def __init__(self, pos, size, groups, name, dialogue=None, package_assigned=False):
@@ -18,30 +25,42 @@ class Interaction(Generic):
         self.package_assigned = package_assigned
         self.delivered = False
 
+class AnimationClock:
+    def __init__(self, frame_count, speed):
+        #one clock drives every sprite sharing an animation, so it advances once per tick
+        self.frame_count = frame_count
+        self.speed = speed
+        self.frame_index = 0
+
+    @property
+    def index(self):
+        return int(self.frame_index)
+
+    def update(self, dt):
+        self.frame_index += self.speed * dt
+        if self.frame_index >= self.frame_count:
+            self.frame_index = 0
+
 class Water(Generic):
-    def __init__(self, pos, frames, groups):
+    animated = True #the image changes with the clock, without an update (watched by the dirty rect renderer)
+
+    def __init__(self, pos, frames, clock, groups):
         #animation setup
         if not frames:
             raise ValueError("Frames cannot be empty for Water animation.")
         self.frames = frames
-        self.frame_index = 0
+        self.clock = clock
 
-        #sprite setup
-        super().__init__(
-            pos = pos,
-            surf = self.frames[self.frame_index],
-            groups = groups,
-            z = LAYERS['water']
-        )
-    
-    def animate(self, dt):
-        self.frame_index += 5 * dt
-        if self.frame_index >= len(self.frames):
-            self.frame_index = 0
-        self.image = self.frames[int(self.frame_index)]
+        #sprite setup, what Generic does but placed by the first frame: the image is looked up from the clock
+        pygame.sprite.Sprite.__init__(self, groups)
+        self.rect = self.frames[0].get_rect(topleft = pos)
+        self.z = LAYERS['water']
+        self.hitbox = self.hitbox_for(self.rect)
 
-    def update(self, dt):
-        self.animate(dt)
+    @property
+    def image(self):
+        #the shared clock's current frame (read only, there is nothing to assign)
+        return self.frames[self.clock.index]
 
 class WildFlower(Generic):
     def __init__(self, pos, surf, groups):
@@ -0,0 +1,125 @@
+import pygame
+from string import printable
+from settings import *
+from profiler import profiler
+
+class GlyphAtlas:
+    def __init__(self, font, color, chars=printable):
+        self.font = font
+        self.color = color
+        self.height = font.get_height()
+
+        #rasterize every glyph once, side by side on a single surface
+        chars = [char for char in dict.fromkeys(chars) if char.isprintable()]
+        rendered = [font.render(char, True, color) for char in chars]
+        profiler.count('font.render', len(rendered))
+        self.surface = pygame.Surface((sum(glyph.get_width() for glyph in rendered) or 1, self.height), pygame.SRCALPHA)
+
+        self.glyphs = {} #char -> (surface, source rect, advance)
+        x = 0
+        for char, glyph in zip(chars, rendered):
+            area = pygame.Rect(x, 0, glyph.get_width(), glyph.get_height())
+            self.surface.blit(glyph, area, special_flags=pygame.BLEND_RGBA_MAX)
+            self.glyphs[char] = (self.surface, area, glyph.get_width())
+            x += glyph.get_width()
+
+        self.layouts = {}
+        self.rendered = {}
+
+    def glyph(self, char):
+        #characters outside the atlas are rasterized on first use
+        if char not in self.glyphs:
+            surf = self.font.render(char, True, self.color)
+            profiler.count('font.render')
+            self.glyphs[char] = (surf, surf.get_rect(), surf.get_width())
+        return self.glyphs[char]
+
+    def width(self, text):
+        return sum(self.glyph(char)[2] for char in text)
+
+    def wrap(self, text, width):
+        words = text.split(" ")
+        wrapped_lines = []
+        current_line = ""
+
+        for word in words:
+            test_line = f"{current_line} {word}".strip()
+            if self.width(test_line) <= width:
+                current_line = test_line
+            else:
+                wrapped_lines.append(current_line)
+                current_line = word
+
+        if current_line:
+            wrapped_lines.append(current_line)
+        return wrapped_lines
+
+    def layout(self, text, width, line_spacing=0):
+        #glyph positions in reading order, cached per text and box width
+        key = (text, width, line_spacing)
+        if key not in self.layouts:
+            placements = []
+            y = 0
+            for line in self.wrap(text, width):
+                placements += self.place_line(line, y)
+                y += self.height + line_spacing
+            self.layouts[key] = placements
+        return self.layouts[key]
+
+    def place_line(self, line, y=0):
+        #uncached, for text that changes every time it's drawn
+        placements = []
+        x = 0
+        for char in line:
+            placements.append((char, (x, y)))
+            x += self.glyph(char)[2]
+        return placements
+
+    def draw(self, surface, placements, origin=(0, 0), special_flags=pygame.BLEND_RGBA_MAX):
+        #the default copies glyphs onto transparent surfaces, pass 0 to blend onto opaque ones
+        left, top = origin
+        for char, (x, y) in placements:
+            glyph_surf, area, _ = self.glyph(char)
+            surface.blit(glyph_surf, (left + x, top + y), area, special_flags=special_flags)
+        profiler.count('blits', len(placements))
+
+    def render(self, text):
+        #single line text, cached
+        if text not in self.rendered:
+            surf = pygame.Surface((max(self.width(text), 1), self.height), pygame.SRCALPHA)
+            self.draw(surf, self.layout(text, surf.get_width()))
+            self.rendered[text] = surf
+        return self.rendered[text]
+
+class TypewriterText:
+    def __init__(self, atlas, size, wrap_width=None, line_spacing=0, speed=0):
+        self.atlas = atlas
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.wrap_width = wrap_width or size[0]
+        self.line_spacing = line_spacing
+        self.speed = speed #characters per second, 0 shows the whole text at once
+        self.set_text("")
+
+    def set_text(self, text):
+        self.placements = self.atlas.layout(text, self.wrap_width, self.line_spacing)
+        self.surface.fill((0, 0, 0, 0))
+        self.revealed = 0
+        self.progress = 0
+
+    @property
+    def done(self):
+        return self.revealed >= len(self.placements)
+
+    def update(self, dt):
+        if self.done:
+            return
+
+        if self.speed:
+            self.progress += self.speed * dt
+            target = min(len(self.placements), int(self.progress))
+        else:
+            target = len(self.placements)
+
+        #only the newly revealed glyphs are blitted, the rest stay on the cached surface
+        self.atlas.draw(self.surface, self.placements[self.revealed:target])
+        self.revealed = target
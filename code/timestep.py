@@ -0,0 +1,36 @@
+from settings import *
+from inputs import InputState
+
+class FixedTimestep:
+    def __init__(self, level, step=FIXED_STEP, max_steps=MAX_CATCH_UP_STEPS):
+        # The level advances in ticks of exactly step seconds, however long the frames take. Frame time
+        # builds up in the accumulator, each whole step of it is simulated and the leftover fraction
+        # is drawn by interpolating between the last two ticks
+        self.level = level
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+        #key changes wait for the next tick, so a press on a frame without one isn't lost
+        self.pressed = set()
+        self.released = set()
+
+    def run(self, frame_time, inputs):
+        # Ticks as many steps as the frame time covers, at most max_steps: past that (a stall, or a CPU that can't
+        # keep up) the rest is dropped and the game slows down instead of falling further behind. Returns what
+        # Level.draw returns
+        self.accumulator += frame_time
+        self.pressed |= inputs.pressed
+        self.released |= inputs.released
+
+        steps = 0
+        while self.accumulator >= self.step and steps < self.max_steps:
+            self.level.step(self.step, InputState(inputs.held, self.pressed, self.released))
+            self.pressed.clear()
+            self.released.clear()
+            self.accumulator -= self.step
+            steps += 1
+        if self.accumulator >= self.step:
+            self.accumulator %= self.step
+
+        return self.level.draw(self.accumulator / self.step)
@@ -1,5 +1,7 @@
 import pygame, os
 from settings import *
+from assets import assets
+from hud import TextWidget
 
 class Transition:
 	def __init__(self, reset, sky):
@@ -8,8 +10,7 @@ class Transition:
 		self.reset = reset
 		self.sky = sky
 
-		#overlay image
-		self.image = pygame.Surface((SCREEN_WIDTH,SCREEN_HEIGHT))
+		#fade, applied as a multiply factor by the compositor
 		self.color = 255
 		self.speed = 100
 
@@ -18,8 +19,9 @@ class Transition:
 		self.message_timer = 0
 		
 		font_path = os.path.join(os.path.dirname(__file__), "../graphics/fonts/PressStart2P-vaV7.ttf")
-		font = pygame.font.Font(font_path, 20)
+		font = assets.font(font_path, 20)
 		self.font = font
+		self.message = TextWidget(font, "The Next Day...", WHITE, center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
 
 	def play(self, dt):
 		# print(f"Transition state: {self.state}, Color: {self.color}, Sky reached_end_color: {self.sky.reached_end_color}") #DEBUG
@@ -31,12 +33,13 @@ class Transition:
 			if self.color <= 0:
 				self.color = 0
 				self.state = "message"
-				self.message_timer = pygame.time.get_ticks()
+				self.message_timer = 0
 				self.reset()  #reset the sky and level
 
 		elif self.state == "message":
-			current_time = pygame.time.get_ticks()
-			if current_time - self.message_timer > 2000: #display msg for 2 secs
+			#timed in game time (dt), so headless runs can go faster than real time
+			self.message_timer += dt
+			if self.message_timer > 2: #display msg for 2 secs
 				self.state = "fade_out"
 		
 		elif self.state == "fade_out":
@@ -44,19 +47,16 @@ class Transition:
 			if self.color >= 255:
 				self.color = 255
 				self.state = "idle"
-		
-		if self.state != "idle":
-			self.draw_transition()
-	
-	def draw_transition(self):
-		int_color = max(0, min(255, int(self.color)))
-		self.image.fill((int_color, int_color, int_color))
-		self.display_surface.blit(self.image, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
 
+	@property
+	def fade(self):
+		int_color = max(0, min(255, int(self.color))) if self.state != "idle" else 255
+		return (int_color, int_color, int_color)
+
+	def draw_transition(self):
+		#drawn after the compositor pass, so the message itself isn't faded
 		if self.state == "message":
-			text_surface = self.font.render("The Next Day...", True, WHITE)
-			text_rect = text_surface.get_rect(center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-			self.display_surface.blit(text_surface, text_rect)
+			self.message.draw(self.display_surface)
 	
 	def reset(self):
 		self.sky.reset()
@@ -0,0 +1,256 @@
+import pygame, threading
+from queue import Queue
+from settings import *
+from sprites import Generic, Water, WildFlower, Trees
+
+BAKED_LAYERS = ('Fence', 'HouseWall', 'HouseDoor', 'HouseRoof')
+
+def bake_strips(tiles):
+    # Chunks are CHUNK_TILES wide but only one tile tall, so they y-sort against the player
+    # exactly like the individual tiles would. tiles are (x, y, surf, order), the strip takes its first tile's order
+    strips = {}
+    for x, y, surf, order in tiles:
+        strips.setdefault((x // CHUNK_TILES, y), []).append((x, surf, order))
+
+    baked = []
+    for (_, y), strip in strips.items():
+        left = min(x for x, _, _ in strip)
+        right = max(x for x, _, _ in strip) + 1
+        chunk_surf = pygame.Surface(((right - left) * TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+        for x, surf, _ in strip:
+            # Tiles never overlap inside a layer, so copy pixels (alpha included) without blending
+            chunk_surf.blit(surf, ((x - left) * TILE_SIZE, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        baked.append(((left * TILE_SIZE, y * TILE_SIZE), chunk_surf, strip[0][2]))
+    return baked
+
+def bake_water(tiles, water_frames):
+    # Every animation frame is pre-baked per square, all squares share the water clock
+    squares = {}
+    for x, y, _, order in tiles:
+        squares.setdefault((x // WATER_CHUNK_TILES, y // WATER_CHUNK_TILES), []).append((x, y, order))
+
+    baked = []
+    for square in squares.values():
+        left = min(x for x, _, _ in square)
+        top = min(y for _, y, _ in square)
+        width = (max(x for x, _, _ in square) + 1 - left) * TILE_SIZE
+        height = (max(y for _, y, _ in square) + 1 - top) * TILE_SIZE
+
+        frames = []
+        for frame in water_frames:
+            chunk_surf = pygame.Surface((width, height), pygame.SRCALPHA)
+            for x, y, _ in square:
+                chunk_surf.blit(frame, ((x - left) * TILE_SIZE, (y - top) * TILE_SIZE), special_flags=pygame.BLEND_RGBA_MAX)
+            frames.append(chunk_surf)
+        baked.append(((left * TILE_SIZE, top * TILE_SIZE), frames, square[0][2]))
+    return baked
+
+class WorldChunk:
+    def __init__(self, key):
+        self.key = key
+        self.tiles = {} #layer name -> [(x, y, surf, order)]
+        self.objects = {} #layer name -> [(obj, order)]
+        self.baked = None #layer name -> baked surfaces, filled by bake() on either thread
+        self.sprites = [] #live sprites while the chunk is loaded
+        self.lock = threading.Lock()
+
+class ChunkedWorld:
+    def __init__(self, tmx_data, layer_definitions, all_sprites, water_frames, water_clock, streaming=WORLD_STREAMING):
+        # Tile and object layers are indexed by WORLD_CHUNK_TILES square chunks. Without streaming every
+        # chunk is built right away, otherwise only the chunks near the player are (see update)
+        self.layer_definitions = layer_definitions
+        self.all_sprites = all_sprites
+        self.water_frames = water_frames
+        self.water_clock = water_clock
+        self.streaming = streaming
+        self.chunks = {}
+        self.loaded = set()
+        self.focus_chunk = None #the chunk the focus was in at the last update
+
+        # Everything gets its place in the draw order of a full, unchunked build, so chunks
+        # loaded in any order still draw the same (the orders are negative: before later sprites)
+        items = []
+        size = WORLD_CHUNK_TILES
+        for layer_name in layer_definitions:
+            layer = tmx_data.get_layer_by_name(layer_name)
+            if hasattr(layer, 'tiles'):
+                for x, y, surf in layer.tiles():
+                    items.append((x // size, y // size, layer_name, 'tiles', (x, y, surf)))
+            else:
+                for obj in layer:
+                    if hasattr(obj, 'image'):
+                        key = (int(obj.x // TILE_SIZE) // size, int(obj.y // TILE_SIZE) // size)
+                        items.append((*key, layer_name, 'objects', (obj,)))
+
+        for order, (cx, cy, layer_name, kind, item) in enumerate(items, start=-len(items)):
+            if (cx, cy) not in self.chunks:
+                self.chunks[(cx, cy)] = WorldChunk((cx, cy))
+            getattr(self.chunks[(cx, cy)], kind).setdefault(layer_name, []).append((*item, order))
+
+        # Chunks ahead of the player are baked on a background thread
+        self.prefetch_queue = Queue()
+        self.queued = set()
+        self.prefetched = set() #keys handed to the prefetcher and not loaded since
+        self.prefetch_surfaces = {} #tile image -> the worker's own copy of it
+        self.prefetcher = None
+
+        if not streaming:
+            for key in self.chunks:
+                self.load(key)
+
+    def bake_sources(self, chunk):
+        #layer name -> tiles for the layers bake() turns into chunk surfaces
+        return {layer_name: tiles for layer_name, tiles in chunk.tiles.items()
+                if STATIC_CHUNKS and self.all_sprites in self.layer_definitions[layer_name]
+                and (layer_name in BAKED_LAYERS or layer_name == 'Water')}
+
+    def bake(self, chunk, sources=None, water_frames=None):
+        # Surfaces only, no sprites. The prefetch worker passes its own copies of the tile images and
+        # water frames (see prefetch), the main thread keeps blitting from the shared ones meanwhile
+        with chunk.lock:
+            if chunk.baked is None:
+                baked = {}
+                if sources is None:
+                    sources, water_frames = self.bake_sources(chunk), self.water_frames
+                for layer_name, tiles in sources.items():
+                    if layer_name == 'Water':
+                        baked[layer_name] = bake_water(tiles, water_frames)
+                    else:
+                        baked[layer_name] = bake_strips(tiles)
+                chunk.baked = baked
+            return chunk.baked
+
+    def load(self, key):
+        chunk = self.chunks[key]
+        baked = self.bake(chunk)
+        sprites = chunk.sprites
+
+        for layer_name, tiles in chunk.tiles.items():
+            groups = self.layer_definitions[layer_name]
+            if layer_name in baked:
+                # Draw baked chunks; keep per-tile sprites only for the other groups (hitboxes)
+                for pos, surf, order in baked[layer_name]:
+                    if layer_name == 'Water':
+                        sprites.append(Water(pos, surf, self.water_clock, groups))
+                    else:
+                        sprites.append(Generic(pos, surf, [self.all_sprites]))
+                    sprites[-1].draw_order = order
+                groups = [group for group in groups if group is not self.all_sprites]
+                if not groups:
+                    continue
+
+            for x, y, surf, order in tiles:
+                if layer_name == 'Water':
+                    sprite = Water((x * TILE_SIZE, y * TILE_SIZE), self.water_frames, self.water_clock, groups)
+                else:
+                    sprite = Generic((x * TILE_SIZE, y * TILE_SIZE), surf, groups)
+                sprite.draw_order = order
+                sprites.append(sprite)
+
+        for layer_name, objects in chunk.objects.items():
+            groups = self.layer_definitions[layer_name]
+            for obj, order in objects:
+                if layer_name == 'Decoration':
+                    sprite = WildFlower((obj.x, obj.y), obj.image, groups)
+                else:
+                    sprite = Trees((obj.x, obj.y), obj.image, groups, obj.name)
+                sprite.draw_order = order
+                sprites.append(sprite)
+
+        self.loaded.add(key)
+        self.prefetched.discard(key)
+
+    def evict(self, key):
+        chunk = self.chunks[key]
+        for sprite in chunk.sprites:
+            sprite.kill()
+        chunk.sprites = []
+        with chunk.lock:
+            chunk.baked = None
+        self.loaded.discard(key)
+
+    def update(self, focus, direction):
+        # Streaming: load the chunks within WORLD_LOAD_RADIUS of the focus (the player), evict the ones past
+        # WORLD_EVICT_RADIUS and have the next ring in the walking direction baked in the background
+        if not self.streaming:
+            return
+
+        size = WORLD_CHUNK_TILES * TILE_SIZE
+        cx, cy = int(focus[0] // size), int(focus[1] // size)
+        radius = WORLD_LOAD_RADIUS
+
+        # Which chunks belong loaded only changes when the focus enters another chunk
+        if (cx, cy) != self.focus_chunk:
+            self.focus_chunk = (cx, cy)
+            for y in range(cy - radius, cy + radius + 1):
+                for x in range(cx - radius, cx + radius + 1):
+                    if (x, y) in self.chunks and (x, y) not in self.loaded:
+                        self.load((x, y))
+
+            for key in [key for key in self.loaded | self.prefetched
+                        if max(abs(key[0] - cx), abs(key[1] - cy)) > WORLD_EVICT_RADIUS]:
+                if key in self.loaded:
+                    self.evict(key)
+                elif key not in self.queued:
+                    chunk = self.chunks[key]
+                    with chunk.lock:
+                        chunk.baked = None #prefetched, but the player turned away
+                    self.prefetched.discard(key)
+
+        if WORLD_PREFETCH and (direction.x or direction.y):
+            step_x = (direction.x > 0) - (direction.x < 0)
+            step_y = (direction.y > 0) - (direction.y < 0)
+            ahead = radius + 1
+            for offset in range(-radius, radius + 1):
+                keys = []
+                if step_x:
+                    keys.append((cx + step_x * ahead, cy + offset))
+                if step_y:
+                    keys.append((cx + offset, cy + step_y * ahead))
+                for key in keys:
+                    self.prefetch(key)
+
+    def prefetch(self, key):
+        # The tile images are subsurfaces of tilesets the main thread keeps drawing from, so the
+        # worker gets copies of them (made here, once per image) and never touches the originals
+        chunk = self.chunks.get(key)
+        if chunk is None or chunk.baked is not None or key in self.queued:
+            return
+        if self.prefetcher is None:
+            self.prefetch_water_frames = [frame.copy() for frame in self.water_frames]
+            self.prefetcher = threading.Thread(target=self.prefetch_worker, daemon=True)
+            self.prefetcher.start()
+
+        sources = {}
+        for layer_name, tiles in self.bake_sources(chunk).items():
+            if layer_name == 'Water':
+                sources[layer_name] = tiles #baked from the water frames, the tile images go unused
+                continue
+            sources[layer_name] = [(x, y, self.prefetch_surface(surf), order) for x, y, surf, order in tiles]
+        self.queued.add(key)
+        self.prefetched.add(key)
+        self.prefetch_queue.put((key, sources))
+
+    def prefetch_surface(self, surf):
+        copy = self.prefetch_surfaces.get(surf)
+        if copy is None:
+            copy = self.prefetch_surfaces[surf] = surf.copy()
+        return copy
+
+    def prefetch_worker(self):
+        while True:
+            key, sources = self.prefetch_queue.get()
+            self.bake(self.chunks[key], sources, self.prefetch_water_frames)
+            self.queued.discard(key)
+
+    def hitboxes(self, group):
+        #collision boxes of everything in the group across the whole map, loaded or not (e.g. for navigation)
+        for chunk in self.chunks.values():
+            for layer_name, tiles in chunk.tiles.items():
+                if group in self.layer_definitions[layer_name]:
+                    for x, y, surf, _ in tiles:
+                        yield Generic.hitbox_for(surf.get_rect(topleft=(x * TILE_SIZE, y * TILE_SIZE)))
+            for layer_name, objects in chunk.objects.items():
+                if group in self.layer_definitions[layer_name]:
+                    for obj, _ in objects:
+                        yield Generic.hitbox_for(obj.image.get_rect(topleft=(obj.x, obj.y)))